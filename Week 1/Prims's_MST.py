@@ -3,102 +3,142 @@ Your task is to run Prim's minimum spanning tree algorithm on this graph.
 You should report the overall cost of a minimum spanning tree --- an integer,
 which may or may not be negative --- in the box below.
 """
-import heapq
-from collections import defaultdict
-from itertools import count
+import os
+import sys
 from math import inf
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.csr_graph import CSRGraph  # noqa: E402
+
 
 class Heap:
     """
-    heap data structure with removing based on
-    https://docs.python.org/3.5/library/heapq.html#priority-queue-implementation-notes
-    need to add counter as a hack, otherwise when comparing [math.inf, '<removed-task>'], [math.inf, 4]
-    Python will error out:
-    http://stackoverflow.com/questions/16373809/python-huffman-coding-exception-unorderable-types
+    d-ary min-heap over integer nodes with a position index.
+    Keeping the position of every node in the heap gives a real decrease_key, so an edge that does not improve
+    the score never touches the heap and no '<removed-node>' tombstones pile up: the heap never grows past n entries.
     """
 
-    def __init__(self, heap=[]):
-        heapq.heapify(heap)
-        self.heap = heap  # list of entries arranged in a heap
-        self.entry_finder = {i[-1]: i for i in heap}  # mapping of nodes to entries (score, node)
-        self.REMOVED = '<removed-node>'  # placeholder for a removed node
-        self.counter = count()  # a hack
+    def __init__(self, size, arity=4):
+        self.arity = arity
+        self.heap = []  # list of nodes arranged in a heap
+        self.scores = [inf] * size  # node -> current score
+        self.position = [-1] * size  # node -> index in self.heap, -1 if the node is not in the heap
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, node):
+        return self.position[node] >= 0
 
     def add_node(self, node, score=0):
-        """Add a new node or update the Dijkstra score of an existing node"""
-        if node in self.entry_finder:
-            self.remove_node(node)
-        cnt = next(self.counter)
-        entry = [score, cnt, node]
-        self.entry_finder[node] = entry
-        heapq.heappush(self.heap, entry)
-
-    def remove_node(self, node):
-        """Mark an existing node as REMOVED.  Raise KeyError if not found."""
-        entry = self.entry_finder.pop(node)
-        entry[-1] = self.REMOVED
+        """Add a new node to the heap"""
+        self.scores[node] = score
+        self.position[node] = len(self.heap)
+        self.heap.append(node)
+        self.__sift_up(len(self.heap) - 1)
+
+    def decrease_key(self, node, score):
+        """Lower the score of a node in the heap if score is smaller. Return True if the heap has been touched"""
+        if score >= self.scores[node]:
+            return False
+        self.scores[node] = score
+        self.__sift_up(self.position[node])
+        return True
 
     def get_score(self, node):
-        """Get node's old score in O(1) time before updating it"""
-        return self.entry_finder[node][0]
+        """Get node's current score in O(1) time"""
+        return self.scores[node]
 
     def pop_node(self):
-        """Remove and return the node with the lowest Dijkstra score. Raise KeyError if empty."""
-        while self.heap:
-            score, junk, node = heapq.heappop(self.heap)
-            if node is not self.REMOVED:
-                del self.entry_finder[node]
-                return score, node
-        raise KeyError('pop from an empty priority queue')
+        """Remove and return the node with the lowest score. Raise KeyError if empty."""
+        if not self.heap:
+            raise KeyError('pop from an empty priority queue')
+        top = self.heap[0]
+        last = self.heap.pop()
+        self.position[top] = -1
+        if self.heap:
+            self.heap[0] = last
+            self.position[last] = 0
+            self.__sift_down(0)
+        return self.scores[top], top
+
+    def __sift_up(self, i):
+        heap, scores, position, arity = self.heap, self.scores, self.position, self.arity
+        node = heap[i]
+        score = scores[node]
+        while i > 0:
+            parent = (i - 1) // arity
+            parent_node = heap[parent]
+            if scores[parent_node] <= score:
+                break
+            heap[i] = parent_node
+            position[parent_node] = i
+            i = parent
+        heap[i] = node
+        position[node] = i
+
+    def __sift_down(self, i):
+        heap, scores, position, arity = self.heap, self.scores, self.position, self.arity
+        size = len(heap)
+        node = heap[i]
+        score = scores[node]
+        while True:
+            first = i * arity + 1
+            if first >= size:
+                break
+            # pick the smallest of up to arity children
+            best, best_score = first, scores[heap[first]]
+            for child in range(first + 1, min(first + arity, size)):
+                child_score = scores[heap[child]]
+                if child_score < best_score:
+                    best, best_score = child, child_score
+            if best_score >= score:
+                break
+            heap[i] = heap[best]
+            position[heap[i]] = i
+            i = best
+        heap[i] = node
+        position[node] = i
 
 
 def load_graph(file_name):
-    res = defaultdict(set)
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # split the lines
-    lines = file_contents.split('\n')
-    # pop n and m, we'll not use them
-    lines.pop(0)
-    for line in lines:
-        spl = line.split()
-        if spl:
-            node1, node2, cost = map(int, spl)
-            res[node1].add((node2, cost))
-            res[node2].add((node1, cost))
-    return res
+    """reads the file into an undirected CSR graph with 0-based vertices, every edge is stored in both directions"""
+    return CSRGraph.from_file(file_name, undirected=True)
 
 
 def create_heap(graph):
-    # create a list to serve as heap, assign the source(first) vertex the score of 0, infinity for the rest
-    counter = count()
-    to_be_heap = [[0 if node == 1 else inf, next(counter), node] for node in graph]
-    return Heap(to_be_heap)
+    # assign the source(first) vertex the score of 0, infinity for the rest
+    heap = Heap(graph.number_of_vertices)
+    for node in range(graph.number_of_vertices):
+        heap.add_node(node, 0 if node == 0 else inf)
+    return heap
 
 
 def calculate_prims_mst(graph, heap):
-    explored = set()
-    unexplored = set(node for node in graph)
+    """returns the total cost of the MST and the list of its edges (node1, node2, cost) with 0-based vertices"""
     total_mst_cost = 0
-    while len(unexplored) > 0:
-        # we pop next vertex w
+    mst_edges = []
+    # the vertex through which each unexplored vertex got its current score
+    parents = [-1] * graph.number_of_vertices
+    offsets, targets, weights = graph.offsets.tolist(), graph.targets.tolist(), graph.weights.tolist()
+    while len(heap) > 0:
+        # we pop next vertex w, the heap holds exactly the unexplored vertices
         new_score, new_vertex = heap.pop_node()
-        explored.add(new_vertex)
-        unexplored.remove(new_vertex)
         total_mst_cost += new_score
+        if parents[new_vertex] >= 0:
+            mst_edges.append((parents[new_vertex], new_vertex, new_score))
         # make sure we pay the piper
-        for node, edge_cost in graph[new_vertex]:  # for each v of edges (w, v)
-            if node in unexplored:  # if it's a crossing edge
-                current_score = heap.get_score(node)  # set its score to the min{(its current score), (C(w, v))}
-                heap.remove_node(node)
-                score = min(current_score, edge_cost)
-                heap.add_node(node, score)
-    return total_mst_cost
+        for e in range(offsets[new_vertex], offsets[new_vertex + 1]):  # for each v of edges (w, v)
+            node = targets[e]
+            # if it's a crossing edge set its score to the min{(its current score), (C(w, v))}
+            if node in heap and heap.decrease_key(node, weights[e]):
+                parents[node] = new_vertex
+    return total_mst_cost, mst_edges
 
 
 if __name__ == '__main__':
     gr = load_graph('edges.txt')
     h = create_heap(gr)
-    print('Total length of  MST: {0}'.format(calculate_prims_mst(gr, h)))
+    cost, edges = calculate_prims_mst(gr, h)
+    print('Total length of  MST: {0}'.format(cost))
+    print('Edges in MST: {0}'.format(len(edges)))
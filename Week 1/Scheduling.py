@@ -11,32 +11,315 @@ Your task now is to run the greedy algorithm that schedules jobs (optimally) in
 (weight/length). In this algorithm, it does not matter how you break ties. You should report the sum of weighted
 completion times of the resulting schedule --- a positive integer --- in the box below.
 """
-from itertools import accumulate
+import numpy as np
+import os
+import random
+import sys
+from fractions import Fraction
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.loader import load_table  # noqa: E402
+
+# schedule switches to Python ints when the weighted completion sum could reach this
+INT64_LIMIT = np.iinfo(np.int64).max
 
 
 def load_jobs(file_name):
-    res = []
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # build list of jobs
-    lines = file_contents.split('\n')
-    _ = lines.pop(0)
-    for line in lines:
-        spl = line.split()
-        if spl:
-            weight, length = map(int, spl)
-            res.append((weight, length))
-    return res
-
-
-def schedule(jobs_list, sort_key):
-    sorted_jobs = sorted(jobs_list, key=sort_key, reverse=True)
-    acc_lengths = accumulate(job[1] for job in sorted_jobs)
-    weighted_completion_times = (al * job[0] for al, job in zip(acc_lengths, sorted_jobs))
-    return sum(weighted_completion_times)
+    """
+    reads the file and returns 2 int64 numpy arrays: weights and lengths
+    [number_of_jobs]
+    [job_1_weight] [job_1_length]
+    ...
+    """
+    _, jobs = load_table(file_name, columns=2)
+    return np.array(jobs[:, 0]), np.array(jobs[:, 1])
+
+
+def schedule_order(weights, lengths, rule):
+    """
+    the order of the jobs, rule='difference' is decreasing (weight - length) with the higher weight first on ties,
+    rule='ratio' is decreasing weight/length compared exactly
+    """
+    if rule == 'difference':
+        # the last key is the primary one
+        return np.lexsort((-weights, -(weights - lengths)))
+    if rule != 'ratio':
+        raise ValueError('Unknown scheduling rule: {0}'.format(rule))
+    ratios = weights / lengths
+    order = np.argsort(-ratios, kind='stable')
+    # correctly rounded division never swaps two ratios, it can only make different ones equal,
+    # so only the runs of equal floats need the exact comparison
+    sorted_ratios = ratios[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_ratios[1:] != sorted_ratios[:-1], [True])))
+    for start, end in zip(starts[:-1].tolist(), starts[1:].tolist()):
+        if end - start > 1:
+            run = order[start:end].tolist()
+            run.sort(key=lambda job: Fraction(int(weights[job]), int(lengths[job])), reverse=True)
+            order[start:end] = run
+    return order
+
+
+def schedule_key(weight, length, rule):
+    """the exact key of a job, the jobs are scheduled in increasing order of it, see schedule_order"""
+    if rule == 'difference':
+        return length - weight, -weight
+    if rule != 'ratio':
+        raise ValueError('Unknown scheduling rule: {0}'.format(rule))
+    # the weight and the length only tell apart jobs of equal ratios, their order doesn't change the sum
+    return -Fraction(weight, length), -weight, -length
+
+
+def schedule(weights, lengths, rule):
+    """the sum of weighted completion times of the jobs scheduled by the rule, see schedule_order"""
+    order = schedule_order(weights, lengths, rule)
+    weights, lengths = weights[order], lengths[order]
+    # the sum is at most the total weight times the total length, past int64 the arrays hold Python ints
+    if int(weights.sum(dtype=object)) * int(lengths.sum(dtype=object)) > INT64_LIMIT:
+        weights, lengths = weights.astype(object), lengths.astype(object)
+    return int(np.dot(weights, np.cumsum(lengths)))
+
+
+class FenwickTree:
+    """prefix sums over positions 0..size-1 with O(log n) updates, Python ints so nothing overflows"""
+
+    def __init__(self, size):
+        self.__tree = [0] * (size + 1)
+
+    def add(self, position, delta):
+        position += 1
+        while position < len(self.__tree):
+            self.__tree[position] += delta
+            position += position & -position
+
+    def prefix(self, position):
+        """the sum over positions 0..position-1"""
+        total = 0
+        while position > 0:
+            total += self.__tree[position]
+            position -= position & -position
+        return total
+
+
+class OfflineScheduler:
+    """
+    Keeps the sum of weighted completion times of a changing subset of jobs scheduled by the rule, the offline
+    variant of OnlineScheduler: every job that can show up is given upfront and sorted once, insert and remove
+    switch them on and off by index. Two Fenwick trees over the sorted order hold the lengths and the weights
+    of the jobs that are on: a job at position p finishes after the lengths before p plus its own, and delays
+    the weights after p.
+    """
+
+    def __init__(self, weights, lengths, rule='ratio'):
+        self.__weights = np.asarray(weights).tolist()
+        self.__lengths = np.asarray(lengths).tolist()
+        order = schedule_order(np.asarray(weights), np.asarray(lengths), rule)
+        self.__positions = [0] * len(order)
+        for position, job in enumerate(order.tolist()):
+            self.__positions[job] = position
+        self.__length_sums = FenwickTree(len(order))
+        self.__weight_sums = FenwickTree(len(order))
+        self.__scheduled = [False] * len(order)
+        self.total_weight = 0
+        self.weighted_completion_time = 0
+
+    def insert(self, job):
+        if self.__scheduled[job]:
+            raise ValueError('Job {0} is already scheduled'.format(job))
+        self.__scheduled[job] = True
+        self.__update(job, 1)
+
+    def remove(self, job):
+        if not self.__scheduled[job]:
+            raise ValueError('Job {0} is not scheduled'.format(job))
+        self.__scheduled[job] = False
+        self.__update(job, -1)
+
+    def __contains__(self, job):
+        return self.__scheduled[job]
+
+    def __update(self, job, sign):
+        position = self.__positions[job]
+        weight, length = self.__weights[job], self.__lengths[job]
+        if sign < 0:
+            self.__length_sums.add(position, -length)
+            self.__weight_sums.add(position, -weight)
+            self.total_weight -= weight
+        lengths_before = self.__length_sums.prefix(position)
+        weights_after = self.total_weight - self.__weight_sums.prefix(position + 1)
+        self.weighted_completion_time += sign * (weight * (lengths_before + length) + length * weights_after)
+        if sign > 0:
+            self.__length_sums.add(position, length)
+            self.__weight_sums.add(position, weight)
+            self.total_weight += weight
+
+
+class OnlineScheduler:
+    """
+    Keeps the sum of weighted completion times of a changing set of jobs scheduled by the rule, a job that was
+    never seen before can arrive at any time. The jobs are kept in a treap ordered by their exact schedule_key,
+    identical jobs share a node, and every node holds the total length and weight of its subtree, so the lengths
+    before a job and the weights after it are found in O(log n) expected: the job finishes after the lengths
+    before it plus its own, and delays the weights after it.
+    """
+
+    def __init__(self, rule='ratio', seed=None):
+        if rule not in ('difference', 'ratio'):
+            raise ValueError('Unknown scheduling rule: {0}'.format(rule))
+        self.__rule = rule
+        self.__random = random.Random(seed)
+        # node 0 is the empty subtree, the nodes of removed keys are reused
+        self.__keys = [None]
+        self.__jobs = [(0, 0)]
+        self.__priorities = [0.0]
+        self.__left = [0]
+        self.__right = [0]
+        self.__counts = [0]
+        self.__length_sums = [0]
+        self.__weight_sums = [0]
+        self.__free = []
+        self.__nodes = {}
+        self.__root = 0
+        self.__size = 0
+        self.total_weight = 0
+        self.weighted_completion_time = 0
+
+    def insert(self, weight, length):
+        weight, length = int(weight), int(length)
+        key = schedule_key(weight, length, self.__rule)
+        lengths_before, weights_after = self.__around(key)
+        node = self.__nodes.get(key)
+        if node is None:
+            node = self.__new_node(key, weight, length)
+            less, greater = self.__split(self.__root, key)
+            self.__root = self.__merge(self.__merge(less, node), greater)
+        else:
+            # an identical job goes after the ones already there
+            lengths_before += self.__counts[node] * length
+            self.__add_along(key, 1)
+        self.weighted_completion_time += weight * (lengths_before + length) + length * weights_after
+        self.total_weight += weight
+        self.__size += 1
+
+    def remove(self, weight, length):
+        weight, length = int(weight), int(length)
+        key = schedule_key(weight, length, self.__rule)
+        node = self.__nodes.get(key)
+        if node is None:
+            raise ValueError('Job ({0}, {1}) is not scheduled'.format(weight, length))
+        lengths_before, weights_after = self.__around(key)
+        # the last of the identical jobs leaves
+        lengths_before += (self.__counts[node] - 1) * length
+        self.weighted_completion_time -= weight * (lengths_before + length) + length * weights_after
+        self.total_weight -= weight
+        self.__size -= 1
+        self.__add_along(key, -1)
+        if not self.__counts[node]:
+            self.__delete_node(key)
+
+    def __contains__(self, job):
+        weight, length = job
+        return schedule_key(int(weight), int(length), self.__rule) in self.__nodes
+
+    def __len__(self):
+        return self.__size
+
+    def __around(self, key):
+        """the total length of the jobs with keys before the key and the total weight of those after it"""
+        lengths_before = weights_after = 0
+        node = self.__root
+        while node:
+            left, right = self.__left[node], self.__right[node]
+            if key < self.__keys[node]:
+                weight, _ = self.__jobs[node]
+                weights_after += self.__weight_sums[right] + self.__counts[node] * weight
+                node = left
+            elif self.__keys[node] < key:
+                _, length = self.__jobs[node]
+                lengths_before += self.__length_sums[left] + self.__counts[node] * length
+                node = right
+            else:
+                return lengths_before + self.__length_sums[left], weights_after + self.__weight_sums[right]
+        return lengths_before, weights_after
+
+    def __add_along(self, key, delta):
+        """changes the count of the key's node by delta and the sums on the path down to it"""
+        node = self.__nodes[key]
+        weight, length = self.__jobs[node]
+        self.__counts[node] += delta
+        path = self.__root
+        while True:
+            self.__length_sums[path] += delta * length
+            self.__weight_sums[path] += delta * weight
+            if path == node:
+                return
+            path = self.__left[path] if key < self.__keys[path] else self.__right[path]
+
+    def __new_node(self, key, weight, length):
+        node = self.__free.pop() if self.__free else len(self.__keys)
+        if node == len(self.__keys):
+            for values in (self.__keys, self.__jobs, self.__priorities, self.__left, self.__right,
+                           self.__counts, self.__length_sums, self.__weight_sums):
+                values.append(None)
+        self.__keys[node] = key
+        self.__jobs[node] = (weight, length)
+        self.__priorities[node] = self.__random.random()
+        self.__left[node] = self.__right[node] = 0
+        self.__counts[node] = 1
+        self.__length_sums[node] = length
+        self.__weight_sums[node] = weight
+        self.__nodes[key] = node
+        return node
+
+    def __delete_node(self, key):
+        """unlinks the key's node, its subtree sums already exclude it"""
+        node = self.__nodes.pop(key)
+        parent = 0
+        path = self.__root
+        while path != node:
+            parent = path
+            path = self.__left[path] if key < self.__keys[path] else self.__right[path]
+        child = self.__merge(self.__left[node], self.__right[node])
+        if not parent:
+            self.__root = child
+        elif self.__left[parent] == node:
+            self.__left[parent] = child
+        else:
+            self.__right[parent] = child
+        self.__keys[node] = None
+        self.__free.append(node)
+
+    def __split(self, node, key):
+        """the subtrees of the keys before and after the key, which is not in the tree"""
+        if not node:
+            return 0, 0
+        if self.__keys[node] < key:
+            less, greater = self.__split(self.__right[node], key)
+            self.__right[node] = less
+            self.__update(node)
+            return node, greater
+        less, greater = self.__split(self.__left[node], key)
+        self.__left[node] = greater
+        self.__update(node)
+        return less, node
+
+    def __merge(self, less, greater):
+        if not less or not greater:
+            return less or greater
+        if self.__priorities[less] > self.__priorities[greater]:
+            self.__right[less] = self.__merge(self.__right[less], greater)
+            self.__update(less)
+            return less
+        self.__left[greater] = self.__merge(less, self.__left[greater])
+        self.__update(greater)
+        return greater
+
+    def __update(self, node):
+        weight, length = self.__jobs[node]
+        left, right = self.__left[node], self.__right[node]
+        self.__length_sums[node] = self.__length_sums[left] + self.__length_sums[right] + self.__counts[node] * length
+        self.__weight_sums[node] = self.__weight_sums[left] + self.__weight_sums[right] + self.__counts[node] * weight
 
 if __name__ == '__main__':
-    jobs = load_jobs('jobs.txt')
-    print('Difference: {0}'.format(schedule(jobs, lambda t: (t[0] - t[1], t[0]))))
-    print('Ratio: {0}'.format(schedule(jobs, lambda t: t[0]/t[1])))
+    weights, lengths = load_jobs('jobs.txt')
+    print('Difference: {0}'.format(schedule(weights, lengths, 'difference')))
+    print('Ratio: {0}'.format(schedule(weights, lengths, 'ratio')))
@@ -5,76 +5,142 @@ for computing a max-spacing k-clustering.
 Your task in this problem is to run the clustering algorithm from lecture on this data set,
 where the target number k of clusters is set to 4. What is the maximum spacing of a 4-clustering?
 """
+import heapq
+import itertools
+import os
+import sys
+import tempfile
+import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.loader import load_table, parse_rows  # noqa: E402
+from common.union_find import UnionFind  # noqa: E402
 
-class UnionFind:
-    """A fast implementation with lazy unions, ranks and path compression"""
-
-    def __init__(self, size):
-        # a zero-based list of nodes' parents
-        self.__parents = list(range(size))
-        # a zero-based list of their ranks, initially all ranks are 0
-        self.__ranks = [0] * size
-
-    def union(self, node_i, node_j):
-        parent_i = self.find(node_i)
-        parent_j = self.find(node_j)
-        if self.__ranks[parent_i] > self.__ranks[parent_j]:
-            self.__parents[parent_j] = parent_i
-        else:
-            self.__parents[parent_i] = parent_j
-            # only if the ranks are equal, the new parent will have its rank increased
-            if self.__ranks[parent_i] == self.__ranks[parent_j]:
-                self.__ranks[parent_j] += 1
-
-    def find(self, node):
-        # remember all traversed nodes
-        traversed = set()
-        while self.__parents[node] != node:
-            node = self.__parents[node]
-            traversed.add(node)
-        # compress paths
-        for vertex in traversed:
-            self.__parents[vertex] = node
-        return node
+# the number of sorted edges checked at once by build_dendrogram
+KRUSKAL_CHUNK = 4096
+# the number of edges held in memory at once by streaming_k_clustering
+STREAM_BUFFER_EDGES = 1 << 20
 
 
 def load_data(file_name):
-    """reads the file and returns the number of vertices size and a 0-based list of tuples(node1, node2, edge_cost)"""
-    res = []
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # split the lines
-    lines = file_contents.split('\n')
-    # pop n to initialize union find
-    size = int(lines.pop(0))
-    for line in lines:
-        spl = line.split()
-        if spl:
-            node1, node2, cost = map(int, spl)
-            res.append((node1, node2, cost))
-    res = [(i - 1, j - 1, c) for (i, j, c) in res]
-    return size, res
+    """reads the file and returns the number of vertices size and an (m, 3) array of 0-based edges: node1 node2 cost"""
+    header, edges = load_table(file_name, columns=3)
+    return header[0], edges - [1, 1, 0]
 
 
-def kruskals_k_clustering(size, k, edge_list):
+class Dendrogram:
+    """
+    The single-linkage merge sequence from one run of Kruskal: the k-clustering is what's left after the first
+    size - k merges, and its spacing is the weight of the next one, so every k is answered without re-sorting.
+    """
+
+    def __init__(self, size, merges_i, merges_j, weights):
+        self.size = size
+        # the edge (merges_i[t], merges_j[t]) of weight weights[t] is the t-th merge, i.e. the t-th MST edge
+        self.merges_i, self.merges_j, self.weights = merges_i, merges_j, weights
+
+    def spacing(self, k):
+        """the maximum spacing of a k-clustering, inf if the graph has no more than k components"""
+        merge = self.size - k
+        return self.weights[merge] if 0 <= merge < len(self.weights) else float('inf')
+
+    def labels(self, k):
+        """cluster labels 0..k-1 of every node in the k-clustering"""
+        return self.snapshots([k])[0]
+
+    def snapshots(self, ks):
+        """
+        an int32 array of shape (len(ks), size) with the labels of the k-clusterings for every k in ks,
+        the merges are replayed once, from the largest k down
+        """
+        result = np.empty((len(ks), self.size), dtype=np.int32)
+        uf = UnionFind(self.size)
+        done = 0
+        for row in sorted(range(len(ks)), key=lambda r: ks[r], reverse=True):
+            merges = min(max(self.size - ks[row], 0), len(self.weights))
+            uf.union_many(self.merges_i[done:merges], self.merges_j[done:merges])
+            done = max(done, merges)
+            _, result[row] = np.unique(uf.find_many(np.arange(self.size)), return_inverse=True)
+        return result
+
+
+def build_dendrogram(size, edge_list):
+    """
+    runs Kruskal once over the 0-based edges (node1, node2, cost) and records the merges.
+    The edges are taken in chunks, the ones inside a cluster are dropped with one vectorized find
+    and only the rest goes through the sequential unions.
+    """
+    edges = np.asarray(edge_list).reshape(-1, 3)
+    order = np.argsort(edges[:, 2], kind='stable')
+    nodes_i, nodes_j, costs = edges[order, 0], edges[order, 1], edges[order, 2]
     uf = UnionFind(size)
-    edges = sorted(edge_list, key=lambda t: t[2], reverse=True)
-    n = size
-    while n > k:
-        # pop the tuple with the smallest weight
-        u, v, w = edges.pop()
-        if uf.find(u) != uf.find(v):
-            uf.union(u, v)
-            n -= 1
-    # now pop from the list until we come across disjoint points
-    spacing = 0
-    while spacing == 0:
-        u, v, w = edges.pop()
-        if uf.find(u) != uf.find(v):
-            spacing = w
-    return spacing
+    merged = []
+    for start in range(0, len(order), KRUSKAL_CHUNK):
+        if uf.cluster_count == 1:
+            break
+        chunk = slice(start, start + KRUSKAL_CHUNK)
+        apart = np.flatnonzero(uf.find_many(nodes_i[chunk]) != uf.find_many(nodes_j[chunk])) + start
+        for edge in apart.tolist():
+            if uf.union(nodes_i[edge], nodes_j[edge]):
+                merged.append(edge)
+    merged = np.array(merged, dtype=np.int64)
+    return Dendrogram(size, nodes_i[merged], nodes_j[merged], costs[merged])
+
+
+def kruskals_k_clustering(size, k, edge_list):
+    return build_dendrogram(size, edge_list).spacing(k)
+
+
+def sorted_runs(file_name, directory, buffer_edges):
+    """
+    parses the edge file buffer_edges lines at a time, sorts every chunk by cost and saves it as a .npy run
+    of 0-based rows (node1, node2, cost) in directory, returns the number of vertices and the paths of the runs
+    """
+    paths = []
+    with open(file_name) as data:
+        size = int(data.readline())
+        while True:
+            lines = list(itertools.islice(data, buffer_edges))
+            if not lines:
+                break
+            edges = parse_rows(''.join(lines), 3)
+            edges = edges[np.argsort(edges[:, 2], kind='stable')]
+            edges[:, :2] -= 1
+            paths.append(os.path.join(directory, 'run_{0}.npy'.format(len(paths))))
+            np.save(paths[-1], edges)
+    return size, paths
+
+
+def merged_edges(paths, block_edges):
+    """lazily merges the sorted runs by cost, every run is read through a memory map block_edges rows at a time"""
+    def run_edges(path):
+        run = np.load(path, mmap_mode='r')
+        for start in range(0, len(run), block_edges):
+            yield from run[start:start + block_edges].tolist()
+
+    return heapq.merge(*(run_edges(path) for path in paths), key=lambda edge: edge[2])
+
+
+def streaming_k_clustering(file_name, k, buffer_edges=STREAM_BUFFER_EDGES, directory=None):
+    """
+    max spacing of a k-clustering for edge files that don't fit in memory.
+    The file is external-sorted into memory-mapped runs of buffer_edges edges, the runs are merged lazily into
+    the union-find and the merge stops at the first edge between two clusters once there are k of them.
+    Peak memory is the union-find plus about buffer_edges edges.
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as runs_directory:
+        size, paths = sorted_runs(file_name, runs_directory, buffer_edges)
+        uf = UnionFind(size)
+        edges = merged_edges(paths, max(1, buffer_edges // max(1, len(paths))))
+        try:
+            for u, v, w in edges:
+                if uf.cluster_count > k:
+                    uf.union(u, v)
+                elif uf.find(u) != uf.find(v):
+                    return w
+        finally:
+            edges.close()
+    return float('inf')
 
 
 if __name__ == '__main__':
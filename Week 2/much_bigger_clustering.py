@@ -11,90 +11,92 @@ NOTE: The graph implicitly defined by the data file is so big that you probably
 let alone sort the edges by cost. So you will have to be a little creative to complete this part of the question.
 For example, is there some way you can find the smallest distances without explicitly looking at every pair of nodes?
 """
-from collections import defaultdict
+import os
+import sys
 import time
+import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.loader import load_table  # noqa: E402
+from common.union_find import UnionFind  # noqa: E402
 
-class UnionFind:
-    """A fast implementation with lazy unions, ranks and path compression"""
-
-    def __init__(self, nodes):
-        self.__nodes = defaultdict(list)
-        for node in nodes:
-            self.__nodes[node] = [node, 0]
-
-    def union(self, node_i, node_j):
-        parent_i = self.find(node_i)
-        parent_j = self.find(node_j)
-        if parent_i != parent_j:
-            if self.__nodes[parent_i][1] > self.__nodes[parent_j][1]:
-                self.__nodes[parent_j][0] = parent_i
-            else:
-                self.__nodes[parent_i][0] = parent_j
-                # only if the ranks are equal, the new parent will have its rank increased
-                if self.__nodes[parent_i][1] == self.__nodes[parent_j][1]:
-                    self.__nodes[parent_j][1] += 1
-
-    def find(self, node):
-        # remember all traversed nodes
-        traversed = set()
-        while self.__nodes[node][0] != node:
-            node = self.__nodes[node][0]
-            traversed.add(node)
-        # compress paths
-        for vertex in traversed:
-            self.__nodes[vertex][0] = node
-        return node
-
-    @property
-    def cluster_count(self):
-        node_set = set(self.find(value[0]) for value in self.__nodes.values())
-        return len(node_set)
+# the number of code pairs compared at once by hamming_pairs
+PAIR_BLOCK = 1 << 22
 
 
 def load_data(file_name):
-    """reads the file and returns the set of vertices"""
-    res = set()
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # split the lines
-    lines = file_contents.split('\n')
-    # pop n to initialize union find
-    lines.pop(0)
-    for line in lines:
-        s = line.split()
-        if s:
-            res.add(int(''.join(s), 2))
-    return res
-
-
-def calculate_max_k(vertices):
-    uf = UnionFind(vertices)
-    # union all vertices with distance 1
-    for vertex in vertices:
-        for offset in range(24):
-            flipped = toggle_bit(vertex, offset)
-            if flipped in vertices:
-                uf.union(vertex, flipped)
-    # union all vertices with distance 2
-    for vertex in vertices:
-        for i in range(24):
-            for j in range(i, 24):
-                flipped = toggle_bit(vertex, i)
-                flipped = toggle_bit(flipped, j)
-                if flipped in vertices:
-                    uf.union(vertex, flipped)
+    """
+    reads the file and returns the sorted array of distinct vertices as uint32 codes and the number of bits
+    The first line holds the number of nodes and the number of bits per node
+    """
+    (_, bits), rows = load_table(file_name, dtype=np.uint8)
+    # bit i of the row (from the left) has weight 2^(bits-1-i)
+    codes = rows @ (np.uint32(1) << np.arange(bits - 1, -1, -1, dtype=np.uint32))
+    return np.unique(codes.astype(np.uint32)), bits
+
+
+def popcount(values):
+    """the number of set bits of every element of a uint32 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return POPCOUNT_16[values & 0xFFFF] + POPCOUNT_16[values >> 16]
+
+
+POPCOUNT_16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+
+def hamming_pairs(codes, bits, distance):
+    """
+    Returns the arrays (u, v) of indices of all pairs of codes with 0 < Hamming distance <= distance.
+    By the pigeonhole principle such codes agree on at least one of distance+1 chunks of bits, so the codes
+    are bucketed by every chunk and only the pairs within a bucket are checked with a popcount.
+    A pair is kept by the first chunk it agrees on, so it's reported once.
+    """
+    chunks = distance + 1
+    bounds = [bits * c // chunks for c in range(chunks + 1)]
+    masks = [np.uint32(((1 << (high - low)) - 1) << low) for low, high in zip(bounds, bounds[1:])]
+    found_u, found_v = [], []
+    for c, mask in enumerate(masks):
+        keys = codes & mask
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        # boundaries of the buckets of equal keys
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        ends = np.append(starts[1:], len(codes))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end - start < 2:
+                continue
+            bucket = order[start:end]
+            bucket_codes = codes[bucket]
+            # compare the rows of the bucket with the rest of it in blocks of about PAIR_BLOCK pairs
+            rows_per_block = max(1, PAIR_BLOCK // len(bucket))
+            for row in range(0, len(bucket) - 1, rows_per_block):
+                block = bucket_codes[row:row + rows_per_block]
+                xor = block[:, np.newaxis] ^ bucket_codes[np.newaxis, :]
+                distances = popcount(xor)
+                close = (distances <= distance) & (distances > 0)
+                # each unordered pair once
+                close &= np.arange(row, row + len(block))[:, np.newaxis] < np.arange(len(bucket))[np.newaxis, :]
+                for earlier_mask in masks[:c]:
+                    close &= (xor & earlier_mask) != 0
+                i, j = np.nonzero(close)
+                found_u.append(bucket[i + row])
+                found_v.append(bucket[j])
+    if not found_u:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(found_u), np.concatenate(found_v)
+
+
+def calculate_max_k(codes, bits, spacing=3):
+    """the largest k such that there's a k-clustering with spacing at least spacing"""
+    uf = UnionFind(len(codes))
+    # union all vertices closer than spacing
+    uf.union_many(*hamming_pairs(codes, bits, spacing - 1))
     return uf.cluster_count
 
 
-def toggle_bit(int_type, offset):
-    mask = 1 << offset
-    return int_type ^ mask
-
-
 if __name__ == '__main__':
-    v = load_data('clustering_big.txt')
+    v, b = load_data('clustering_big.txt')
     t1 = time.time()
-    print('Maximum number of clusters for spacing 3 is {0}'.format(calculate_max_k(v)))
+    print('Maximum number of clusters for spacing 3 is {0}'.format(calculate_max_k(v, b)))
     print(time.time() - t1)
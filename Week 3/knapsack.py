@@ -6,6 +6,18 @@ In the box below, type in the value of the optimal solution.
 """
 import numpy as np
 import time
+from multiprocessing import Pool
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.loader import load_table  # noqa: E402
+from common.shared_arrays import SharedArrays, attach_arrays  # noqa: E402
+
+# solve_knapsack_problem picks the sparse engine above that capacity per item
+SPARSE_CAPACITY_PER_ITEM = 500
+# solve_knapsack_parallel cuts the merges of a tree level into about that many ranges of capacities per process
+MERGE_RANGES_PER_PROCESS = 4
 
 
 def load_data(file_name):
@@ -16,38 +28,269 @@ def load_data(file_name):
     [value_2] [weight_2]
     ...
     """
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # split the lines
-    lines = file_contents.split('\n')
-    # pop the size and the total number of items to initialize
-    knapsack_size, number_of_items = map(int, lines.pop(0).split())
-    weights, values = np.zeros(number_of_items), np.zeros(number_of_items)
-    i = 0
-    for line in lines:
-        spl = line.split()
-        if spl:
-            values[i], weights[i] = map(int, spl)
-            i += 1
+    (knapsack_size, _), items = load_table(file_name, columns=2)
+    values, weights = np.array(items[:, 0]), np.array(items[:, 1])
     return knapsack_size, weights, values
 
 
-def solve_knapsack_problem(knapsack_size, weights, values):
-    a_current = np.zeros(knapsack_size+1)
-    a_previous = np.zeros(knapsack_size+1)
-    n = len(weights)
-    for i in range(1, n+1):
-        a_current[:weights[i-1]] = a_previous[:weights[i-1]]
-        a_current[weights[i-1]:] = np.fmax(
-            a_previous[weights[i-1]:],
-            a_previous[:knapsack_size + 1 - weights[i-1]] + values[i-1]
-        )
-        np.copyto(a_previous, a_current)
-    return a_current[knapsack_size]
+def solve_knapsack_problem(knapsack_size, weights, values, engine='auto', return_items=False, processes=1):
+    """
+    engine='dense' runs the rolling DP over all capacities 0..knapsack_size,
+    engine='sparse' keeps only the Pareto frontier of non-dominated (weight, value) pairs,
+    engine='auto' picks the sparse one when the capacity is large compared to the number of items.
+    return_items=True returns (value, sorted indices of the chosen items) instead of the value alone,
+    processes > 1 splits the items of the dense engine between processes, see solve_knapsack_parallel,
+    so engine='auto' picks the dense one then. The sparse engine and return_items run in this process only.
+    """
+    if engine == 'auto':
+        sparse = processes == 1 and knapsack_size > SPARSE_CAPACITY_PER_ITEM * len(weights)
+        engine = 'sparse' if sparse else 'dense'
+    if engine not in ('dense', 'sparse'):
+        raise ValueError('Unknown knapsack engine: {0}'.format(engine))
+    if processes > 1 and (engine == 'sparse' or return_items):
+        raise ValueError('Only the value of the dense engine can be solved by several processes')
+    if return_items:
+        items = sorted(choose_items(knapsack_size, np.arange(len(weights)), weights, values, engine))
+        return sum(values[i] for i in items), items
+    if engine == 'sparse':
+        return solve_knapsack_sparse(knapsack_size, weights, values)
+    if processes > 1:
+        return solve_knapsack_parallel(knapsack_size, weights, values, processes)
+    return knapsack_row(knapsack_size, weights, values)[knapsack_size]
+
+
+def knapsack_row(knapsack_size, weights, values, row=None):
+    """
+    the rolling DP, returns the best values for all capacities 0..knapsack_size
+    a single integer row is updated in place: the shifted row plus the value goes to a reused scratch buffer first,
+    so np.maximum reads only the previous item's values and there's no second row to copy back.
+    the items go lightest first and the update stops at the total weight seen so far,
+    because past it the row is flat and everything seen so far fits.
+    A row of the best values of other items can be given to go on from, it's updated in place
+    """
+    weights = np.asarray(weights, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64)
+    order = np.argsort(weights, kind='stable')
+    if row is None:
+        dtype = np.int32 if values.sum() <= np.iinfo(np.int32).max else np.int64
+        row = np.zeros(knapsack_size + 1, dtype=dtype)
+    scratch = np.empty(knapsack_size + 1, dtype=row.dtype)
+    # the row given is flat past its last step
+    steps = np.flatnonzero(np.diff(row))
+    reach = int(steps[-1]) + 1 if len(steps) else 0
+    for weight, value in zip(weights[order].tolist(), values[order].tolist()):
+        if weight > knapsack_size:
+            break
+        # the row is flat past the old reach, extend it before the window grows
+        row[reach + 1:reach + weight + 1] = row[reach]
+        reach = min(reach + weight, knapsack_size)
+        shifted = np.add(row[:reach + 1 - weight], value, out=scratch[:reach + 1 - weight])
+        np.maximum(row[weight:reach + 1], shifted, out=row[weight:reach + 1])
+    row[reach + 1:] = row[reach]
+    return row
+
+
+_worker_state = {}
+
+
+def _init_worker(specs, knapsack_size):
+    blocks, arrays = attach_arrays(specs)
+    _worker_state.update(blocks=blocks, arrays=arrays, knapsack_size=knapsack_size)
+
+
+def _knapsack_group_task(task):
+    group, items = task
+    arrays = _worker_state['arrays']
+    arrays['rows'][group] = knapsack_row(_worker_state['knapsack_size'], arrays['weights'][items],
+                                         arrays['values'][items])
+
+
+def _merge_rows_task(task):
+    level, target, first, second, start, stop = task
+    arrays = _worker_state['arrays']
+    # the levels take turns reading one table and writing the other
+    rows, merged = (arrays['rows'], arrays['merged']) if level % 2 == 0 else (arrays['merged'], arrays['rows'])
+    if second is None:
+        merged[target, start:stop] = rows[first, start:stop]
+    else:
+        merged[target, start:stop] = max_plus_merge(rows[first], rows[second], start, stop)
+
+
+def solve_knapsack_parallel(knapsack_size, weights, values, processes=None, full_row=False):
+    """
+    meet in the middle: the items are dealt out into one group per process and every worker runs knapsack_row
+    for its group into its own row of a shared table. The rows are then merged in pairs by max-plus convolution,
+    level by level like a tree, until two are left. Every merge is cut into ranges of capacities,
+    so all the workers share the merges of a level even when there are fewer pairs than processes.
+    The last two rows are combined only for the single entry at knapsack_size, or merged in full when full_row
+    is set, then the row of the best values for all capacities is returned instead of the value.
+    A merge costs the steps of the row with fewer of them times the capacity, which is more than the DP of the items
+    unless the rows step up rarely, as when the items are heavy compared to the capacity. So before every level
+    merge_pays_off weighs the merges against running knapsack_row over the items of the other rows on top of
+    the first row in this process, and when that's cheaper the rest is solved that way:
+    the speedup depends on the instance and without rare steps the solve takes about as long as the serial one
+    """
+    processes = processes or os.cpu_count()
+    weights = np.asarray(weights, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64)
+    # dealing the items out in the order of weight keeps the groups alike
+    order = np.argsort(weights, kind='stable')
+    groups = [order[group::processes] for group in range(min(processes, len(order)))] or [order]
+    dtype = np.int32 if values.sum() <= np.iinfo(np.int32).max else np.int64
+    with SharedArrays(weights=weights, values=values) as shared:
+        shared.allocate('rows', (len(groups), knapsack_size + 1), dtype)
+        shared.allocate('merged', ((len(groups) + 1) // 2, knapsack_size + 1), dtype)
+        level = 0
+        # the items that every row of the level stands for, and their knapsack_row work
+        members = groups
+        work = [int(np.maximum(knapsack_size + 1 - weights[group], 0).sum()) for group in groups]
+        final = 1 if full_row else 2
+        with Pool(len(groups), _init_worker, (shared.specs, knapsack_size)) as pool:
+            pool.map(_knapsack_group_task, list(enumerate(groups)), chunksize=1)
+            count = len(groups)
+            while count > final:
+                rows = shared.arrays['rows' if level % 2 == 0 else 'merged']
+                steps = [int(np.count_nonzero(np.diff(rows[row]))) for row in range(count)]
+                if not merge_pays_off(steps, work, knapsack_size, processes, final):
+                    others = np.concatenate(members[1:])
+                    row = knapsack_row(knapsack_size, weights[others], values[others], np.array(rows[0]))
+                    return row if full_row else row[knapsack_size]
+                # the low capacities take fewer steps, there are more ranges than processes to even the load out
+                ranges_per_pair = -(-MERGE_RANGES_PER_PROCESS * processes // (count // 2))
+                ranges = np.unique(np.linspace(0, knapsack_size + 1, ranges_per_pair + 1).astype(np.int64)).tolist()
+                # a row left without a pair is copied to the next level
+                tasks = [(level, pair, 2 * pair, 2 * pair + 1 if 2 * pair + 1 < count else None, start, stop)
+                         for pair in range((count + 1) // 2) for start, stop in zip(ranges, ranges[1:])]
+                pool.map(_merge_rows_task, tasks, chunksize=1)
+                members = [np.concatenate(members[row:row + 2]) for row in range(0, count, 2)]
+                work = [sum(work[row:row + 2]) for row in range(0, count, 2)]
+                count = (count + 1) // 2
+                level += 1
+        rows = shared.arrays['rows' if level % 2 == 0 else 'merged']
+        if full_row:
+            return np.array(rows[0])
+        if count == 1:
+            return rows[0][knapsack_size]
+        return (rows[0] + rows[1][::-1]).max()
+
+
+def merge_pays_off(steps, work, knapsack_size, processes, final):
+    """
+    whether merging the next level of rows beats going on from the first row with knapsack_row over the items
+    of the others, given the steps of the rows and the knapsack_row work of their items (a pass over the capacities
+    every item fits in). The merges are shared by the processes and stop at final rows, the steps of a merged row
+    are taken as the sum of the two, about what they come to, and folding after every later level is weighed too
+    """
+    merge_work = 0
+    best_work = processes * sum(work[1:])
+    best_levels = 0
+    levels = 0
+    while len(steps) > final:
+        merge_work += sum(min(steps[row:row + 2]) for row in range(0, len(steps) - 1, 2)) * (knapsack_size + 1)
+        steps = [min(sum(steps[row:row + 2]), knapsack_size) for row in range(0, len(steps), 2)]
+        work = [sum(work[row:row + 2]) for row in range(0, len(work), 2)]
+        levels += 1
+        total_work = merge_work + (processes * sum(work[1:]) if len(steps) > final else 0)
+        if total_work < best_work:
+            best_work, best_levels = total_work, levels
+    return best_levels > 0
+
+
+def max_plus_merge(row_a, row_b, start=0, stop=None):
+    """
+    the max-plus convolution of two best-value rows: merged[c] = max over s of row_a[s] + row_b[c - s]
+    for the capacities start <= c < stop.
+    The rows never go down, so only the capacities where one of them steps up are worth trying as s,
+    the work is the number of steps times the range and the row with fewer steps is the one stepped through.
+    """
+    stop = len(row_b) if stop is None else stop
+    steps_a = np.flatnonzero(np.diff(row_a[:stop])) + 1
+    steps_b = np.flatnonzero(np.diff(row_b[:stop])) + 1
+    if len(steps_b) < len(steps_a):
+        row_a, row_b, steps_a = row_b, row_a, steps_b
+    merged = row_b[start:stop] + row_a[0]
+    scratch = np.empty_like(merged)
+    for step in steps_a.tolist():
+        first = max(start, step)
+        shifted = np.add(row_b[first - step:stop - step], row_a[step], out=scratch[:stop - first])
+        np.maximum(merged[first - start:], shifted, out=merged[first - start:])
+    return merged
+
+
+def solve_knapsack_sparse(knapsack_size, weights, values):
+    """
+    Keeps the Pareto frontier: (weight, value) pairs sorted by weight with strictly increasing values.
+    For every item the frontier shifted by the item is merged into it and the dominated pairs are dropped,
+    so the work per item is proportional to the frontier, not to the capacity.
+    """
+    front_weights, front_values = pareto_front(knapsack_size, weights, values)
+    return front_values[-1]
+
+
+def pareto_front(knapsack_size, weights, values):
+    """the frontier of the items as two arrays: weights ascending and values strictly ascending"""
+    front_weights = np.zeros(1, dtype=np.int64)
+    front_values = np.zeros(1, dtype=np.int64)
+    for weight, value in zip(np.asarray(weights, dtype=np.int64).tolist(), np.asarray(values, dtype=np.int64).tolist()):
+        fits = front_weights <= knapsack_size - weight
+        front_weights, front_values = merge_fronts(front_weights, front_values,
+                                                   front_weights[fits] + weight, front_values[fits] + value)
+    return front_weights, front_values
+
+
+def choose_items(knapsack_size, items, weights, values, engine):
+    """
+    Hirschberg-style divide and conquer: solves the first and the second half of the items for all capacities,
+    picks the split of the capacity with the best total and recurses into both halves with their share.
+    Only the rows of the current level are alive, so the memory is O(W) instead of the O(nW) table,
+    and since the capacities of one level add up to at most W every level costs no more than one value-only solve.
+    """
+    # weight 0 items still fit when the capacity runs out, so only a negative one ends the branch
+    if not len(items) or knapsack_size < 0:
+        return []
+    if len(items) == 1:
+        return [int(items[0])] if weights[items[0]] <= knapsack_size else []
+    first, second = items[:len(items) // 2], items[len(items) // 2:]
+    if engine == 'sparse':
+        first_weights, first_values = pareto_front(knapsack_size, weights[first], values[first])
+        second_weights, second_values = pareto_front(knapsack_size, weights[second], values[second])
+        # for every pair of the first front the heaviest pair of the second front that still fits is the best one
+        fitting = np.searchsorted(second_weights, knapsack_size - first_weights, side='right') - 1
+        split = int(first_weights[np.argmax(first_values + second_values[fitting])])
+    else:
+        first_row = knapsack_row(knapsack_size, weights[first], values[first])
+        second_row = knapsack_row(knapsack_size, weights[second], values[second])
+        split = int(np.argmax(first_row + second_row[::-1]))
+        del first_row, second_row
+    return (choose_items(split, first, weights, values, engine) +
+            choose_items(knapsack_size - split, second, weights, values, engine))
+
+
+def merge_fronts(weights_a, values_a, weights_b, values_b):
+    """merges two weight-sorted fronts in one pass and keeps the non-dominated pairs"""
+    size = len(weights_a) + len(weights_b)
+    # the merged positions, with a before b on equal weights
+    positions_a = np.arange(len(weights_a)) + np.searchsorted(weights_b, weights_a, side='left')
+    positions_b = np.arange(len(weights_b)) + np.searchsorted(weights_a, weights_b, side='right')
+    weights = np.empty(size, dtype=np.int64)
+    values = np.empty(size, dtype=np.int64)
+    weights[positions_a], weights[positions_b] = weights_a, weights_b
+    values[positions_a], values[positions_b] = values_a, values_b
+    # a pair survives if it's worth more than everything lighter
+    best_before = np.maximum.accumulate(np.concatenate(([-1], values[:-1])))
+    keep = values > best_before
+    weights, values = weights[keep], values[keep]
+    # of the survivors with equal weights the last one is worth the most
+    keep = np.append(weights[1:] != weights[:-1], True)
+    return weights[keep], values[keep]
+
 
 if __name__ == '__main__':
     W, w, v = load_data('knapsack1.txt')
     t1 = time.time()
     print('Maximum knapsack value is: {0:.0f}'.format(solve_knapsack_problem(W, w, v)))
     print('Solved in {0:.3f}s'.format(time.time() - t1))
+    t1 = time.time()
+    value, chosen = solve_knapsack_problem(W, w, v, return_items=True)
+    print('Chosen items: {0}, total value {1:.0f}, total weight {2:.0f}'.format(len(chosen), value, w[chosen].sum()))
+    print('Reconstructed in {0:.3f}s'.format(time.time() - t1))
@@ -0,0 +1,48 @@
+"""
+Brute-force checks of the knapsack engines on small instances, run with pytest from this directory.
+"""
+import numpy as np
+import pytest
+
+from knapsack import solve_knapsack_parallel, solve_knapsack_problem
+
+
+def brute_force(knapsack_size, weights, values):
+    """the best value over all the subsets of the items"""
+    subsets = (np.arange(1 << len(weights))[:, np.newaxis] >> np.arange(len(weights))) & 1
+    return (subsets @ values)[subsets @ weights <= knapsack_size].max()
+
+
+def small_instances(cases=60, seed=0):
+    """random small instances with weight 0 items"""
+    rng = np.random.default_rng(seed)
+    instances = []
+    for _ in range(cases):
+        count = int(rng.integers(1, 9))
+        instances.append((int(rng.integers(0, 30)), rng.integers(0, 12, count), rng.integers(1, 20, count)))
+    return instances
+
+
+@pytest.mark.parametrize('engine', ['dense', 'sparse'])
+def test_weight_zero_item_kept_when_capacity_runs_out(engine):
+    # the weight 10 item takes the capacity of its branch down to 0, the weight 0 one still fits
+    value, items = solve_knapsack_problem(17, np.array([0, 10]), np.array([4, 9]), engine, return_items=True)
+    assert value == 13
+    assert items == [0, 1]
+
+
+@pytest.mark.parametrize('engine', ['dense', 'sparse'])
+def test_small_instances(engine):
+    for knapsack_size, weights, values in small_instances():
+        best = brute_force(knapsack_size, weights, values)
+        assert solve_knapsack_problem(knapsack_size, weights, values, engine) == best
+        value, items = solve_knapsack_problem(knapsack_size, weights, values, engine, return_items=True)
+        assert value == best
+        assert weights[items].sum() <= knapsack_size
+        assert values[items].sum() == value
+
+
+def test_parallel_small_instances():
+    for knapsack_size, weights, values in small_instances(cases=10):
+        assert solve_knapsack_parallel(knapsack_size, weights, values, processes=3) == brute_force(
+            knapsack_size, weights, values)
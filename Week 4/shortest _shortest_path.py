@@ -11,73 +11,96 @@ shortest paths in the box below.
 
 import heapq
 import math
-from collections import defaultdict
 import logging
+import os
 import sys
+from collections import deque, namedtuple
+from multiprocessing import Pool
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.csr_graph import CSRGraph  # noqa: E402
+from common.shared_arrays import SharedArrays, attach_arrays  # noqa: E402
 
-class Heap:
-    """
-    heap data structure with removing based on
-    https://docs.python.org/3.5/library/heapq.html#priority-queue-implementation-notes
-    need to mark deleted -1, otherwise when comparing [math.inf, '<removed-task>'], [math.inf, 4]
-    Python will error out:
-    http://stackoverflow.com/questions/16373809/python-huffman-coding-exception-unorderable-types
-    """
-
-    def __init__(self, graph, source):
-        # create a list to serve as heap, assign the source vertex the score of 0, infinity for the rest
-        heap = [[0 if node == source else math.inf, node] for node in graph.keys()]
-        heapq.heapify(heap)
-        self.heap = heap  # list of entries arranged in a heap
-        self.entry_finder = {i[-1]: i for i in heap}  # mapping of nodes to entries (score, node)
-        self.REMOVED = -1  # placeholder for a removed node
-
-    def add_node(self, node, score=0):
-        """Add a new node or update the Dijkstra score of an existing node"""
-        if node in self.entry_finder:
-            self.remove_node(node)
-        entry = [score, node]
-        self.entry_finder[node] = entry
-        heapq.heappush(self.heap, entry)
-
-    def remove_node(self, node):
-        """Mark an existing node as REMOVED.  Raise KeyError if not found."""
-        entry = self.entry_finder.pop(node)
-        entry[-1] = self.REMOVED
-
-    def get_score(self, node):
-        """Get node's old score in O(1) time before updating it"""
-        return self.entry_finder[node][0]
-
-    def pop_node(self):
-        """Remove and return the node with the lowest Dijkstra score. Raise KeyError if empty."""
-        while self.heap:
-            score, node = heapq.heappop(self.heap)
-            if node is not self.REMOVED:
-                del self.entry_finder[node]
-                return score, node
-        raise KeyError('pop from an empty priority queue')
-
-
-def run_dijkstra(edges_dict, heap):
-    length = len(edges_dict)  # the number of vertices n
-    explored = set()
-    unexplored = set(node for node in edges_dict.keys())
-    shortest_paths = np.zeros(length)
-    while len(explored) < length:
-        new_score, new_vertex = heap.pop_node()  # we pop next vertex w
-        explored.add(new_vertex)
-        unexplored.remove(new_vertex)
-        shortest_paths[new_vertex-1] = new_score
-        for node, edge_length in edges_dict[new_vertex]:  # for each v of edges (w, v)
-            if node in unexplored:  # if it's a crossing edge
-                current_score = heap.get_score(node)  # set its score to the min{(its current score), (A[w] + L(w, v))}
-                heap.remove_node(node)
-                score = min(current_score, new_score + edge_length)
-                heap.add_node(node, score)
-    return shortest_paths
+# Floyd-Warshall tile size, a 256 x 256 float64 tile takes 512KB
+FLOYD_WARSHALL_BLOCK = 256
+# the size of the temporary 3D array of a chunk of a min-plus product
+MIN_PLUS_CHUNK_ELEMENTS = 1 << 20
+# solve_apsp picks Floyd-Warshall for at most that many vertices (a float64 matrix of 8000^2 takes 512MB)
+FLOYD_WARSHALL_MAX_VERTICES = 8000
+# and only if n^2 <= FLOYD_WARSHALL_DENSITY_FACTOR * m * log(n)
+FLOYD_WARSHALL_DENSITY_FACTOR = 64
+
+
+def run_dijkstra(adjacency, number_of_vertices, source):
+    """
+    adjacency is (offsets, targets, weights) of a CSR graph with non-negative lengths as Python lists.
+    A vertex enters the heap only when its score drops, stale entries are skipped when popped,
+    so there's no need to build a heap of all n vertices for every source.
+    """
+    offsets, targets, weights = adjacency
+    shortest_paths = [math.inf] * number_of_vertices
+    shortest_paths[source] = 0
+    explored = [False] * number_of_vertices
+    heap = [(0, source)]
+    while heap:
+        new_score, new_vertex = heapq.heappop(heap)  # we pop next vertex w
+        if explored[new_vertex]:
+            continue
+        explored[new_vertex] = True
+        for e in range(offsets[new_vertex], offsets[new_vertex + 1]):  # for each v of edges (w, v)
+            node = targets[e]
+            score = new_score + weights[e]
+            if score < shortest_paths[node]:  # set its score to the min{(its current score), (A[w] + L(w, v))}
+                shortest_paths[node] = score
+                heapq.heappush(heap, (score, node))
+    return np.array(shortest_paths)
+
+
+# state of a process that runs Dijkstra from many sources, set once per worker by _init_worker
+_worker_state = {}
+
+
+def _set_worker_state(arrays, reduction):
+    _worker_state['adjacency'] = (arrays['offsets'].tolist(), arrays['targets'].tolist(),
+                                  arrays['weights'].tolist())
+    _worker_state['potentials'] = arrays['potentials']
+    _worker_state['reduction'] = reduction
+
+
+def _init_worker(specs, reduction):
+    blocks, arrays = attach_arrays(specs)
+    _set_worker_state(arrays, reduction)
+    # keep the shared memory mapped for the lifetime of the worker
+    _worker_state['blocks'] = blocks
+
+
+def _source_row(source):
+    potentials = _worker_state['potentials']
+    shortest_paths_shifted = run_dijkstra(_worker_state['adjacency'], len(potentials), source)
+    shortest_paths = shortest_paths_shifted + potentials - potentials[source]
+    reduction = _worker_state['reduction']
+    return source, shortest_paths if reduction is None else reduction(shortest_paths)
+
+
+def shortest_path_rows(graph, potentials, sources, reduction=np.min, processes=1):
+    """
+    Runs Dijkstra on the reweighted graph from every source and yields (source, reduction(row)) in the order of
+    sources, where row[v] = d'(source, v) + p(v) - p(source) is the true shortest path.
+    With reduction=None the whole row is yielded.
+    With processes > 1 the graph and the potentials are copied to shared memory once and the sources are
+    spread over a pool of workers, only the reduced rows are sent back.
+    """
+    arrays = {'offsets': graph.offsets, 'targets': graph.targets, 'weights': graph.weights,
+              'potentials': potentials}
+    if processes == 1:
+        _set_worker_state(arrays, reduction)
+        yield from map(_source_row, sources)
+        return
+    sources = list(sources)
+    chunk_size = max(1, len(sources) // (processes * 16))
+    with SharedArrays(**arrays) as shared, Pool(processes, _init_worker, (shared.specs, reduction)) as pool:
+        yield from pool.imap(_source_row, sources, chunk_size)
 
 
 def load_graph_from_file(file_name):
@@ -86,20 +109,10 @@ def load_graph_from_file(file_name):
     (the first two numbers are its tail and head, respectively) and its length (the third number).
     NOTE: some of the edge lengths are negative.
     NOTE: These graphs may or may not have negative-cost cycles.
+    Returns a CSR graph with 0-based vertices and the number of vertices.
     """
-    graph = defaultdict(set)
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    lines = file_contents.split('\n')
-    # pop the n and m
-    number_of_vertices, number_of_edges = map(int, lines.pop(0).split())
-    for line in lines:
-        spl = line.split()
-        if spl:
-            tail, head, length = map(int, spl)
-            graph[tail].add((head, length))
-    return graph, number_of_vertices
+    graph = CSRGraph.from_file(file_name)
+    return graph, graph.number_of_vertices
 
 
 def solve_assignment():
@@ -109,66 +122,329 @@ def solve_assignment():
         logger.info('Solving {0}'.format(name))
         g, n = load_graph_from_file(name)
         logger.info('Data loaded from file')
-        tmp = run_johnson(g, n)
-        try:
-            answer = min(answer, tmp)
-        except TypeError:  # when there's a negative cycle and tmp == None
-            pass
+        tmp = run_johnson(g, n, pruned=True)
+        if isinstance(tmp, NegativeCycle):
+            logger.info('Negative cycle of cost {0} through vertices {1}'.format(
+                tmp.cost, [vertex + 1 for vertex in tmp.vertices]))
+            continue
+        answer = min(answer, tmp)
         logger.info('Shortest shortest path is: {0}'.format(tmp))
     logger.info('Assignment answer: {0}'.format(answer))
 
 
-def run_bellman_ford(graph, number_of_vertices, source):
-    # switch to 0-based arrays:
-    source -= 1
+# the witness of a negative cycle: its 0-based vertices in the order of the edges and its total cost
+NegativeCycle = namedtuple('NegativeCycle', ['vertices', 'cost'])
+
+
+def find_negative_cycle(parent_edges, edge_tails, edge_heads, edge_weights):
+    """
+    Looks for a cycle in the graph of the edges through which every vertex got its current score.
+    parent_edges[v] is the index of that edge in edge_tails/edge_heads/edge_weights or -1.
+    All vertices walk to their roots together by pointer doubling, after 2^k >= n steps
+    the ones that did not reach a root stand on a cycle. Returns NegativeCycle or None if there's no
+    cycle of negative cost.
+    """
+    number_of_vertices = len(parent_edges)
+    parents = np.where(parent_edges >= 0, edge_tails[np.maximum(parent_edges, 0)], -1)
+    jumps = parents.copy()
+    for _ in range(max(1, number_of_vertices.bit_length())):
+        walking = jumps >= 0
+        jumps[walking] = jumps[jumps[walking]]
+    on_cycle = jumps[jumps >= 0]
+    if len(on_cycle) == 0:
+        return None
+    # walk the parents back around the cycle
+    start = vertex = int(on_cycle[0])
+    cycle_edges = []
+    while True:
+        cycle_edges.append(int(parent_edges[vertex]))
+        vertex = int(parents[vertex])
+        if vertex == start:
+            break
+    cycle_edges.reverse()
+    cost = edge_weights[cycle_edges].sum()
+    if cost >= 0:
+        # the parents can only form a cycle of zero cost in a tie, it's not a witness
+        return None
+    return NegativeCycle(edge_tails[cycle_edges].tolist(), cost)
+
+
+def run_bellman_ford(graph, number_of_vertices, source, engine='vectorized'):
+    """
+    Shortest paths from the 0-based source to every vertex or NegativeCycle if there's a negative cycle.
+    engine='vectorized' runs every round of BF as one gather and one min per head over the edge arrays,
+    engine='spfa' relaxes only the out-edges of vertices whose distance changed, which suits sparse graphs
+    where few distances move in a round.
+    Both keep the edge through which every vertex got its score and look for a cycle in those edges every
+    few rounds, so a negative cycle is reported as soon as it forms rather than after n rounds.
+    """
+    if engine == 'spfa':
+        return run_spfa(graph, number_of_vertices, source)
+    if engine != 'vectorized':
+        raise ValueError('Unknown Bellman-Ford engine: {0}'.format(engine))
+    # the reversed graph keeps the in-edges of each head contiguous, so the min over them is a single reduceat
+    rev_graph = graph.reverse()
+    edge_heads, edge_tails = rev_graph.tails(), rev_graph.targets
+    heads_with_edges = np.flatnonzero(np.diff(rev_graph.offsets))
+    starts = rev_graph.offsets[heads_with_edges]
     a_previous = np.zeros(number_of_vertices)
-    a_current = np.zeros(number_of_vertices)
-    mask = np.ones(number_of_vertices, dtype=bool)
-    mask[source] = False
-    a_current[mask] = np.inf
-    tmp = np.zeros(number_of_vertices)
+    a_current = np.full(number_of_vertices, np.inf)
+    a_current[source] = 0
+    parent_edges = np.full(number_of_vertices, -1, dtype=np.int64)
+    # checking for a cycle costs O(n log n), so do it every log n rounds
+    check_interval = max(1, number_of_vertices.bit_length())
     # outer loop of BF, iterate from 0 to n-2 (or from 1 to n-1)
-    for i in range(number_of_vertices):
+    i = 0
+    while True:
         np.copyto(a_previous, a_current)
-        tmp[:] = np.inf
-        for tail in graph.keys():
-            for head, length in graph[tail]:
-                # we're talking about 0-based numpy arrays here
-                tmp[head - 1] = min(tmp[head - 1], a_previous[tail - 1] + length)
-        a_current = np.fmin(a_previous, tmp)
+        # A[i][v] = min{A[i-1][v], min over edges (w, v) of A[i-1][w] + L(w, v)}
+        candidates = a_previous[edge_tails] + rev_graph.weights
+        a_current[heads_with_edges] = np.fmin(a_previous[heads_with_edges],
+                                              np.minimum.reduceat(candidates, starts))
         # stopping early
         if np.array_equal(a_current, a_previous):
             logger.info('Stopping Early')
             return a_current
-    # if on the n-th iteration the shortest paths are not the same as on the previous, there was a negative cycle
-    if not np.array_equal(a_current, a_previous):
-        logger.info('Negative cycle detected')
-        return None
-    return a_current
+        # remember an edge that gave each improved vertex its new score
+        improved = a_current < a_previous
+        best_edges = np.flatnonzero(improved[edge_heads] & (candidates == a_current[edge_heads]))
+        parent_edges[edge_heads[best_edges]] = best_edges
+        i += 1
+        # if on the n-th iteration the shortest paths still change, there's a negative cycle,
+        # keep relaxing until it shows up among the parents
+        if i % check_interval == 0 or i >= number_of_vertices:
+            cycle = find_negative_cycle(parent_edges, edge_tails, edge_heads, rev_graph.weights)
+            if cycle is not None:
+                logger.info('Negative cycle detected in round {0}'.format(i))
+                return cycle
 
 
-def run_johnson(graph, number_of_vertices):
-    # add vertex 0 to G
-    vertices = set(range(1, number_of_vertices + 1))
-    graph[number_of_vertices + 1] = {(i, 0) for i in vertices}
-    # calculate shortest paths from 0 to every vertex in G or report a negative cycle
-    b_f_shortest_paths = run_bellman_ford(graph, number_of_vertices + 1, number_of_vertices + 1)
-    if b_f_shortest_paths is None:
-        return None
-    graph_updated = defaultdict(set)
-    for tail in vertices:
-        graph_updated[tail] = {(head, length + b_f_shortest_paths[tail-1] - b_f_shortest_paths[head-1])
-                               for head, length in graph[tail]}
+def run_spfa(graph, number_of_vertices, source):
+    """
+    Queue-based Bellman-Ford (SPFA). A vertex is relaxed only after its distance has dropped.
+    The parent edges are checked for a cycle after every n relaxations and whenever a shortest path needs
+    n or more edges, which means there's a negative cycle.
+    """
+    offsets, targets, weights = graph.offsets.tolist(), graph.targets.tolist(), graph.weights.tolist()
+    edge_tails = graph.tails()
+    shortest_paths = [math.inf] * number_of_vertices
+    path_edges = [0] * number_of_vertices  # the number of edges in the current shortest path to each vertex
+    parent_edges = [-1] * number_of_vertices
+    in_queue = [False] * number_of_vertices
+    shortest_paths[source] = 0
+    queue = deque([source])
+    in_queue[source] = True
+    relaxations = 0
+    while queue:
+        tail = queue.popleft()
+        in_queue[tail] = False
+        tail_score = shortest_paths[tail]
+        for e in range(offsets[tail], offsets[tail + 1]):
+            head = targets[e]
+            score = tail_score + weights[e]
+            if score < shortest_paths[head]:
+                shortest_paths[head] = score
+                path_edges[head] = path_edges[tail] + 1
+                parent_edges[head] = e
+                relaxations += 1
+                if relaxations % number_of_vertices == 0 or path_edges[head] >= number_of_vertices:
+                    cycle = find_negative_cycle(np.array(parent_edges), edge_tails, graph.targets, graph.weights)
+                    if cycle is not None:
+                        logger.info('Negative cycle detected after {0} relaxations'.format(relaxations))
+                        return cycle
+                if not in_queue[head]:
+                    in_queue[head] = True
+                    queue.append(head)
+    return np.array(shortest_paths, dtype=float)
+
+
+def run_pruned_dijkstra(adjacency, potentials, source, bound, min_potential):
+    """
+    Dijkstra on the reweighted graph that only looks for a true path d(source, v) shorter than bound.
+    Popped shifted scores never decrease and d(source, v) = d'(source, v) + p(v) - p(source)
+    >= d'(source, v) + min_potential - p(source), so the search stops once that lower bound reaches bound.
+    Returns the improved bound.
+    """
+    offsets, targets, weights = adjacency
+    source_potential = potentials[source]
+    # the shifted score at which no path from source can beat bound any more
+    cutoff = bound - min_potential + source_potential
+    shortest_paths = {source: 0}
+    explored = set()
+    heap = [(0, source)]
+    while heap:
+        new_score, new_vertex = heapq.heappop(heap)
+        if new_score >= cutoff:
+            break
+        if new_vertex in explored:
+            continue
+        explored.add(new_vertex)
+        true_score = new_score + potentials[new_vertex] - source_potential
+        if true_score < bound:
+            bound = true_score
+            cutoff = bound - min_potential + source_potential
+        for e in range(offsets[new_vertex], offsets[new_vertex + 1]):
+            node = targets[e]
+            score = new_score + weights[e]
+            if score < cutoff and score < shortest_paths.get(node, math.inf):
+                shortest_paths[node] = score
+                heapq.heappush(heap, (score, node))
+    return bound
+
+
+def shortest_shortest_path(graph, potentials):
+    """
+    min over u, v of d(u, v) without computing the full rows.
+    Every edge (u, v) is a path, so the shortest edge and d(u, u) = 0 give the first bound.
+    Sources are tried in the order of their lower bound min_potential - p(source), the most promising first,
+    and once that lower bound can't beat the best path found so far, neither can any of the remaining sources.
+    """
+    adjacency = (graph.offsets.tolist(), graph.targets.tolist(), graph.weights.tolist())
+    true_weights = graph.weights + potentials[graph.targets] - potentials[graph.tails()]
+    best = min(0, true_weights.min()) if len(true_weights) else 0
+    min_potential = potentials.min()
+    order = np.argsort(-potentials, kind='stable').tolist()
+    potentials = potentials.tolist()
+    for source in order:
+        if min_potential - potentials[source] >= best:
+            break
+        best = run_pruned_dijkstra(adjacency, potentials, source, best, min_potential)
+    return best
+
+
+def johnson_reweighting(graph, number_of_vertices):
+    """
+    returns the graph reweighted with non-negative lengths L(u, v) + p(u) - p(v) and the potentials p,
+    or NegativeCycle if there's a negative cycle
+    """
+    # add vertex s = n to G with zero-length edges to every vertex
+    tails, heads = graph.tails(), graph.targets
+    vertices = np.arange(number_of_vertices, dtype=np.int32)
+    graph_with_s = CSRGraph.from_edges(
+        number_of_vertices + 1,
+        np.concatenate((tails, np.full(number_of_vertices, number_of_vertices, dtype=np.int32))),
+        np.concatenate((heads, vertices)),
+        np.concatenate((graph.weights, np.zeros(number_of_vertices, dtype=graph.weights.dtype)))
+    )
+    # calculate shortest paths from s to every vertex in G or report a negative cycle
+    b_f_shortest_paths = run_bellman_ford(graph_with_s, number_of_vertices + 1, number_of_vertices)
+    if isinstance(b_f_shortest_paths, NegativeCycle):
+        return b_f_shortest_paths
+    potentials = b_f_shortest_paths[:-1]
+    return graph.with_weights(graph.weights + potentials[tails] - potentials[heads]), potentials
+
+
+def run_johnson(graph, number_of_vertices, processes=1, pruned=False):
+    """
+    min over u, v of d(u, v) or NegativeCycle if there's a negative cycle.
+    pruned=True only searches for that minimum with bounded Dijkstras instead of computing every full row,
+    it runs in this process.
+    """
+    reweighted = johnson_reweighting(graph, number_of_vertices)
+    if isinstance(reweighted, NegativeCycle):
+        return reweighted
+    graph_updated, b_f_shortest_paths = reweighted
     # all edges are non-negative, ready to run Dijkstra
+    if pruned:
+        return shortest_shortest_path(graph_updated, b_f_shortest_paths)
     tmp = np.inf
-    for source in vertices:
-        heap = Heap(graph_updated, source)
-        shortest_paths_shifted = run_dijkstra(graph_updated, heap)
-        shortest_paths = shortest_paths_shifted + b_f_shortest_paths[:-1] - b_f_shortest_paths[source - 1]
-        tmp = min(tmp, min(shortest_paths))
+    rows = shortest_path_rows(graph_updated, b_f_shortest_paths, range(number_of_vertices), processes=processes)
+    for source, row_min in rows:
+        tmp = min(tmp, row_min)
     return tmp
 
 
+def min_plus_update(target, left, right):
+    """
+    target = min(target, left * right) in the (min, +) semiring,
+    i.e. target[i][j] = min(target[i][j], min over k of left[i][k] + right[k][j]).
+    The k dimension is processed in chunks so the 3D temporary stays at about MIN_PLUS_CHUNK_ELEMENTS.
+    """
+    rows, inner = left.shape
+    chunk = max(1, MIN_PLUS_CHUNK_ELEMENTS // max(1, rows * right.shape[1]))
+    for k in range(0, inner, chunk):
+        candidates = left[:, k:k + chunk, np.newaxis] + right[np.newaxis, k:k + chunk, :]
+        np.minimum(target, candidates.min(axis=1), out=target)
+
+
+def run_floyd_warshall(graph, number_of_vertices, dtype=np.float64, block_size=FLOYD_WARSHALL_BLOCK):
+    """
+    Blocked Floyd-Warshall over a numpy distance matrix, returns the n x n shortest paths or NegativeCycle
+    if there's a negative cycle (a negative entry on the diagonal).
+    The matrix keeps no paths, so the witness cycle is then found by the Bellman-Ford run of johnson_reweighting,
+    and if that finds none the negative diagonal came from the rounding or the overflow of dtype and the matrix
+    is computed again in float64.
+    For every diagonal block K: close D[K, K] with the plain recurrence, then update the row strip D[K, :]
+    and the column strip D[:, K] through it and finally every other tile with a min-plus product of the strips,
+    so the k loop runs over tiles that stay in cache.
+    dtype may be float32 (exact for path lengths up to 2**24) or an integer type to halve the memory,
+    with integer types unreachable pairs hold np.iinfo(dtype).max.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        unreachable = np.inf
+    else:
+        # leaves room to add two unreachable entries without overflow
+        unreachable = np.iinfo(dtype).max // 4
+    n = number_of_vertices
+    a = np.full((n, n), unreachable, dtype=dtype)
+    # keep the shortest of parallel edges
+    np.minimum.at(a, (graph.tails(), graph.targets), graph.weights.astype(dtype))
+    a[np.diag_indices(n)] = np.minimum(a.diagonal(), 0)
+    for k_start in range(0, n, block_size):
+        k_block = slice(k_start, min(k_start + block_size, n))
+        diagonal = a[k_block, k_block]
+        for k in range(diagonal.shape[0]):
+            np.minimum(diagonal, diagonal[:, k, np.newaxis] + diagonal[np.newaxis, k, :], out=diagonal)
+        min_plus_update(a[k_block, :], diagonal.copy(), a[k_block, :].copy())
+        min_plus_update(a[:, k_block], a[:, k_block].copy(), diagonal.copy())
+        row_strip, column_strip = a[k_block, :].copy(), a[:, k_block].copy()
+        for i_start in range(0, n, block_size):
+            i_block = slice(i_start, min(i_start + block_size, n))
+            for j_start in range(0, n, block_size):
+                j_block = slice(j_start, min(j_start + block_size, n))
+                min_plus_update(a[i_block, j_block], column_strip[i_block], row_strip[:, j_block])
+        if (a.diagonal() < 0).any():
+            # a negative cycle is already there, no need to finish
+            reweighted = johnson_reweighting(graph, number_of_vertices)
+            if isinstance(reweighted, NegativeCycle):
+                logger.info('Negative cycle detected')
+                return reweighted
+            # rounding in float32 or an overflow in a narrow integer type made a cycle look negative
+            if dtype == np.float64:
+                raise ValueError('Negative diagonal in the distance matrix without a negative cycle')
+            logger.info('No negative cycle behind the negative diagonal in {0}, running in float64'.format(dtype))
+            return run_floyd_warshall(graph, number_of_vertices, np.float64, block_size)
+    if dtype.kind != 'f':
+        a[a >= unreachable // 2] = np.iinfo(dtype).max
+    return a
+
+
+def solve_apsp(graph, number_of_vertices, engine='auto'):
+    """
+    All-pairs shortest paths as an n x n matrix or NegativeCycle if there's a negative cycle.
+    engine is 'johnson', 'floyd_warshall' or 'auto', which picks Floyd-Warshall when the matrix is small enough
+    and the graph is dense enough for n vectorized rounds of n^2 work to beat n Python-level Dijkstras.
+    """
+    if engine == 'auto':
+        n, m = number_of_vertices, graph.number_of_edges
+        dense = n * n <= FLOYD_WARSHALL_DENSITY_FACTOR * m * max(1, math.log2(n))
+        engine = 'floyd_warshall' if n <= FLOYD_WARSHALL_MAX_VERTICES and dense else 'johnson'
+        logger.info('APSP engine: {0}'.format(engine))
+    if engine == 'floyd_warshall':
+        return run_floyd_warshall(graph, number_of_vertices)
+    if engine != 'johnson':
+        raise ValueError('Unknown APSP engine: {0}'.format(engine))
+    reweighted = johnson_reweighting(graph, number_of_vertices)
+    if isinstance(reweighted, NegativeCycle):
+        return reweighted
+    graph_updated, potentials = reweighted
+    result = np.empty((number_of_vertices, number_of_vertices))
+    for source, row in shortest_path_rows(graph_updated, potentials, range(number_of_vertices), reduction=None):
+        result[source] = row
+    return result
+
+
 if __name__ == '__main__':
     # initialize logging to console
     logger = logging.getLogger()
@@ -3,13 +3,24 @@ In this assignment you will implement one or more algorithms for the traveling s
 such as the dynamic programming algorithm covered in the video lectures.
 """
 import numpy as np
-import time
+import heapq
 import itertools
-from collections import defaultdict
-from scipy.spatial import distance
+import math
+import time
+from collections import deque, namedtuple
+from multiprocessing import Pool
+from scipy.spatial import distance, cKDTree
 import logging
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.loader import load_table  # noqa: E402
+from common.shared_arrays import SharedArrays, attach_arrays  # noqa: E402
+
+# the number of (subset, j, k) candidates evaluated at once by held_karp_chunk
+CHUNK_ELEMENTS = 1 << 22
+
 
 def load_data(file_name):
     """
@@ -19,68 +30,641 @@ def load_data(file_name):
     The distance between two cities is defined as the Euclidean distance --- that is,
     two cities at locations (x,y) and (z,w) have distance (x−z)2+(y−w)2 between them.
     """
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # split the lines
-    lines = file_contents.split('\n')
-    # pop the total number of cities
-    cities_count = int(lines.pop(0))
-    cities = np.zeros((cities_count, 2), dtype='float32')
-    i = 0
-    for line in lines:
-        spl = line.split()
-        if spl:
-            cities[i][0], cities[i][1] = map(float, spl)
-            i += 1
+    (cities_count,), cities = load_table(file_name, dtype=np.float64, columns=2)
+    cities = cities.astype('float32')
     logger.info('Data loaded')
     return cities_count, cities
 
 
-def subset_without_city(city_id, subset):
-    return subset ^ (1 << city_id)
+def solve_tsp(cities_count, cities):
+    return solve_tsp_layered(cities_count, cities)
 
 
-def solve_tsp(cities_count, cities):
+def solve_tsp_layered(cities_count, cities, return_tour=False, processes=1, spill_directory=None):
+    """
+    Held-Karp that keeps only the layers of subsets of size m-1 and m.
+    City 0 is always in the subset, so a subset is a set S of the other cities, encoded as 0..cities_count-2,
+    and it's stored at its combinatorial (colex) rank among the subsets of the same size, not at its bitmask.
+    A row of a layer holds A[S][j] only for the cities j in S, in increasing order.
+    With return_tour=True a uint8 table of the best previous city is kept for every layer to rebuild the tour,
+    returns (tour length, list of cities starting at 0).
+    With processes > 1 the subsets of every layer are split over a pool of workers, see held_karp_parallel.
+    """
     dist = distances(cities)
-    full_set = 2 ** cities_count - 1
-    A = np.empty((2 ** cities_count, cities_count), dtype='float32')
-    A[:] = np.inf
-    A[0][0] = 0
-    for i in range(1, cities_count):
-        s = (1 << i) + 1
-        A[s][i] = dist[0][i]
-    powers = defaultdict(int)
-    for e in range(cities_count-1):
-        powers[1 << e] = e
-    # since the city #0 is always there, the rightmost bit is always set
-    # also, to be able to get min over k!=j, need to have at least 3 cities in subset
-    for m in range(2, cities_count):
+    others = cities_count - 1
+    binomials = binomial_table(others)
+    # subsets of size 1: A[{j}][j] = d(0, j)
+    layer = dist[0, 1:].astype('float32').reshape(others, 1)
+    parents = [np.zeros((others, 1), dtype='uint8')]
+    if processes > 1:
+        layer, parents = held_karp_parallel(layer, parents, others, dist, binomials, return_tour, processes,
+                                            spill_directory)
+    for m in range(layer.shape[1] + 1, others + 1):
         logger.info('Subset size: {0}'.format(m))
-        sets = bit_sets(powers, m)
-        for s, bits in sets.items():  # generate subset of size m
-            subset = (s << 1) + 1  # the actual subset has city #0 in the rightmost bit
-            for j in bits:  # all the cities that there are in S
-                A[subset][j+1] = min(A[subset_without_city(j+1, subset)] + dist[j+1])
-    tour = np.inf
-    for j in range(1, cities_count):
-        tour = min(tour, A[full_set][j] + dist[0][j])
+        layer, layer_parents = held_karp_layer(layer, m, others, dist, binomials)
+        if return_tour:
+            parents.append(layer_parents)
+    # the only subset of size n-1 contains all the cities, close the tour with the edge back to city 0
+    last_legs = layer[0] + dist[1:, 0]
+    last = int(np.argmin(last_legs))
+    tour_length = last_legs[last]
+    if not return_tour:
+        return tour_length
+    return tour_length, rebuild_tour(parents, last, others, binomials)
+
+
+def binomial_table(n):
+    """binomials[a][b] = C(a, b) for a, b <= n"""
+    binomials = np.zeros((n + 1, n + 2), dtype='int64')
+    binomials[:, 0] = 1
+    for a in range(1, n + 1):
+        binomials[a, 1:] = binomials[a - 1, 1:] + binomials[a - 1, :-1]
+    return binomials
+
+
+def subset_rank(elements, binomials):
+    """colex rank of the subset given by its increasing elements: sum of C(e_i, i+1)"""
+    return sum(int(binomials[e][i + 1]) for i, e in enumerate(elements))
+
+
+def unrank_subsets(ranks, m, binomials):
+    """returns the (len(ranks), m) array of the increasing elements of the subsets of size m with given colex ranks"""
+    elements = np.empty((len(ranks), m), dtype='int64')
+    ranks = ranks.copy()
+    for i in range(m - 1, -1, -1):
+        # the i-th element is the largest e with C(e, i+1) <= rank
+        elements[:, i] = np.searchsorted(binomials[:, i + 1], ranks, side='right') - 1
+        ranks -= binomials[elements[:, i], i + 1]
+    return elements
+
+
+def held_karp_chunk(previous, m, first_rank, last_rank, dist, binomials):
+    """
+    computes the rows first_rank..last_rank-1 of the layer of subsets of size m from the layer of size m-1,
+    returns them and the position of the best previous city in S - {j} for every entry.
+    All the subsets of the chunk are handled at once: for the t-th city j of S the rank of S - {j} is
+    sum of C(e_i, i+1) over i < t plus sum of C(e_i, i) over i > t.
+    """
+    elements = unrank_subsets(np.arange(first_rank, last_rank, dtype='int64'), m, binomials)
+    columns = np.arange(m)
+    ranks_below = np.cumsum(binomials[elements, columns + 1], axis=1) - binomials[elements, columns + 1]
+    high = binomials[elements, columns]
+    ranks_above = np.cumsum(high[:, ::-1], axis=1)[:, ::-1] - high
+    values = np.empty((last_rank - first_rank, m), dtype='float32')
+    parents = np.empty(values.shape, dtype='uint8')
+    for t in range(m):
+        previous_rows = previous[ranks_below[:, t] + ranks_above[:, t]]
+        previous_cities = np.delete(elements, t, axis=1)
+        # A[S][j] = min over k in S - {j} of A[S - {j}][k] + d(k, j)
+        candidates = previous_rows + dist[previous_cities + 1, elements[:, t, np.newaxis] + 1]
+        parents[:, t] = np.argmin(candidates, axis=1)
+        values[:, t] = np.take_along_axis(candidates, parents[:, t, np.newaxis].astype('int64'), axis=1)[:, 0]
+    return values, parents
+
+
+def held_karp_layer(previous, m, others, dist, binomials):
+    """
+    computes the layer of subsets of size m from the layer of size m-1 in chunks of about CHUNK_ELEMENTS
+    candidates, returns the layer and the position of the best previous city in S - {j} for every entry
+    """
+    layer_size = int(binomials[others][m])
+    layer = np.empty((layer_size, m), dtype='float32')
+    layer_parents = np.empty(layer.shape, dtype='uint8')
+    chunk = max(1, CHUNK_ELEMENTS // (m * m))
+    for first_rank in range(0, layer_size, chunk):
+        last_rank = min(first_rank + chunk, layer_size)
+        layer[first_rank:last_rank], layer_parents[first_rank:last_rank] = held_karp_chunk(
+            previous, m, first_rank, last_rank, dist, binomials)
+    return layer, layer_parents
+
+
+# state of a Held-Karp worker process: the distances, the binomials and the mapped layers of the current task
+_worker_state = {}
+
+
+def _init_worker(dist, binomials):
+    _worker_state.update(dist=dist, binomials=binomials, specs=None, blocks=[], arrays=None)
+
+
+def _held_karp_task(task):
+    specs, m, first_rank, last_rank = task
+    if _worker_state['specs'] != specs:
+        # a new layer, drop the mappings of the previous one
+        _worker_state['arrays'] = None
+        for block in _worker_state['blocks']:
+            block.close()
+        _worker_state['blocks'], _worker_state['arrays'] = attach_arrays(specs)
+        _worker_state['specs'] = specs
+    arrays = _worker_state['arrays']
+    values, parents = held_karp_chunk(arrays['previous'], m, first_rank, last_rank, _worker_state['dist'],
+                                      _worker_state['binomials'])
+    arrays['layer'][first_rank:last_rank] = values
+    arrays['parents'][first_rank:last_rank] = parents
+
+
+def held_karp_parallel(layer, parents, others, dist, binomials, return_tour, processes, spill_directory=None):
+    """
+    computes the layers of sizes 2..others on a pool of workers, returns the last layer and the parent tables.
+    The previous and the current layer live in shared memory, or in memory-mapped files in spill_directory,
+    every worker fills in its own range of ranks of the current layer. The layer is done when all of its
+    chunks are, that's the barrier before the next one starts.
+    """
+    previous = SharedArrays(spill_directory, layer=layer)
+    try:
+        with Pool(processes, _init_worker, (dist, binomials)) as pool:
+            for m in range(2, others + 1):
+                logger.info('Subset size: {0}'.format(m))
+                layer_size = int(binomials[others][m])
+                current = SharedArrays(spill_directory)
+                current.allocate('layer', (layer_size, m), 'float32')
+                current.allocate('parents', (layer_size, m), 'uint8')
+                specs = {'previous': previous.specs['layer'], 'layer': current.specs['layer'],
+                         'parents': current.specs['parents']}
+                # several chunks per worker to even out the load
+                chunk = max(1, min(CHUNK_ELEMENTS // (m * m), -(-layer_size // (processes * 4))))
+                tasks = [(specs, m, first_rank, min(first_rank + chunk, layer_size))
+                         for first_rank in range(0, layer_size, chunk)]
+                pool.map(_held_karp_task, tasks, chunksize=1)
+                if return_tour:
+                    parents.append(np.array(current.arrays['parents']))
+                previous.close()
+                previous = current
+        return np.array(previous.arrays['layer']), parents
+    finally:
+        previous.close()
+
+
+def rebuild_tour(parents, last, others, binomials):
+    """walks the parent tables from the full subset ending at position last down to a single city"""
+    elements = list(range(others))
+    position = last
+    tour = []
+    for m in range(others, 0, -1):
+        rank = subset_rank(elements, binomials)
+        tour.append(elements[position] + 1)
+        next_position = int(parents[m - 1][rank][position])
+        del elements[position]
+        position = next_position
+    return [0] + tour[::-1]
+
+
+def solve_tsp_heuristic(cities_count, cities, construction='greedy', neighbours_count=10):
+    """
+    Near-optimal tour for large instances, memory grows linearly in n since the distance matrix is never built.
+    The starting tour comes from construction='greedy' (greedy edge matching) or 'nearest_neighbour',
+    both driven by a k-d tree, then it's improved by 2-opt and Or-opt moves limited to the neighbours_count
+    nearest cities of every city. Returns the length of the tour and the tour starting at city 0.
+    """
+    points = np.asarray(cities, dtype='float64')
+    if cities_count <= 3:
+        tour = np.arange(cities_count)
+        return tour_length(points, tour), tour
+    tree = cKDTree(points)
+    # the nearest neighbour of a city is normally itself, it's skipped later on
+    _, neighbours = tree.query(points, min(neighbours_count, cities_count - 1) + 1)
+    if construction == 'greedy':
+        tour = greedy_tour(points, neighbours)
+    elif construction == 'nearest_neighbour':
+        tour = nearest_neighbour_tour(points)
+    else:
+        raise ValueError('Unknown construction: {0}'.format(construction))
+    logger.info('Initial tour length: {0:.2f}'.format(tour_length(points, tour)))
+    tour = LocalSearch(points, tour, neighbours).run()
+    tour = np.roll(tour, -int(np.flatnonzero(tour == 0)[0]))
+    return tour_length(points, tour), tour
+
+
+def tour_length(points, tour):
+    ordered = points[tour]
+    return float(np.hypot(*(ordered - np.roll(ordered, -1, axis=0)).T).sum())
+
+
+class NearestUnvisited:
+    """
+    k-d tree over points that can be marked visited. It's rebuilt over the remaining points once half of the
+    points in it are visited, so a query with a doubling k finds an unvisited point quickly.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.visited = np.zeros(len(points), dtype=bool)
+        self.remaining = len(points)
+        self.__rebuild()
+
+    def __rebuild(self):
+        self.__ids = np.flatnonzero(~self.visited)
+        self.__tree = cKDTree(self.points[self.__ids])
+        self.__visited_in_tree = 0
+
+    def visit(self, point_id):
+        self.visited[point_id] = True
+        self.remaining -= 1
+        self.__visited_in_tree += 1
+        if self.remaining > 0 and self.__visited_in_tree * 2 > len(self.__ids):
+            self.__rebuild()
+
+    def nearest(self, point):
+        """the nearest unvisited point"""
+        k = 8
+        while True:
+            k = min(k, len(self.__ids))
+            _, found = self.__tree.query(point, k)
+            candidates = self.__ids[np.atleast_1d(found)]
+            candidates = candidates[~self.visited[candidates]]
+            if len(candidates) > 0:
+                return int(candidates[0])
+            k *= 2
+
+
+def nearest_neighbour_tour(points):
+    unvisited = NearestUnvisited(points)
+    tour = [0]
+    unvisited.visit(0)
+    while unvisited.remaining > 0:
+        tour.append(unvisited.nearest(points[tour[-1]]))
+        unvisited.visit(tour[-1])
+    return np.array(tour)
+
+
+def greedy_tour(points, neighbours):
+    """
+    Greedy edge matching: takes the candidate edges to the nearest neighbours from the shortest up,
+    as long as both ends have degree < 2 and the edge doesn't close a cycle.
+    The resulting paths are then chained, each one to the nearest free end of another path.
+    """
+    cities_count = len(points)
+    pairs = np.column_stack((np.repeat(np.arange(cities_count), neighbours.shape[1]), neighbours.ravel()))
+    pairs = np.unique(np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1), axis=0)
+    order = np.argsort(np.hypot(*(points[pairs[:, 0]] - points[pairs[:, 1]]).T), kind='stable')
+    links = [[] for _ in range(cities_count)]
+    # union-find with path halving to keep the paths acyclic
+    parents = list(range(cities_count))
+
+    def find(node):
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    for u, v in pairs[order].tolist():
+        if len(links[u]) < 2 and len(links[v]) < 2:
+            root_u, root_v = find(u), find(v)
+            if root_u != root_v:
+                parents[root_u] = root_v
+                links[u].append(v)
+                links[v].append(u)
+    ends = np.array([city for city in range(cities_count) if len(links[city]) < 2])
+    end_ids = np.full(cities_count, -1)
+    end_ids[ends] = np.arange(len(ends))
+    free_ends = NearestUnvisited(points[ends])
+    tour = []
+    start = int(ends[0])
+    while True:
+        # walk the path from one end to the other
+        previous, city = -1, start
+        while True:
+            tour.append(city)
+            following = [next_city for next_city in links[city] if next_city != previous]
+            if not following:
+                break
+            previous, city = city, following[0]
+        free_ends.visit(end_ids[start])
+        if city != start:
+            free_ends.visit(end_ids[city])
+        if free_ends.remaining == 0:
+            return np.array(tour)
+        start = int(ends[free_ends.nearest(points[city])])
+
+
+class LocalSearch:
+    """
+    2-opt and Or-opt over an array tour with the position of every city.
+    Only moves that bring in an edge to one of the nearest neighbours of a city are tried,
+    and a city is looked at again only if one of its tour edges has changed (don't-look bits).
+    """
+    EPSILON = 1e-9
+
+    def __init__(self, points, tour, neighbours):
+        self.xs, self.ys = points[:, 0].tolist(), points[:, 1].tolist()
+        self.tour = np.array(tour)
+        self.size = len(self.tour)
+        self.position = np.empty(self.size, dtype='int64')
+        self.position[self.tour] = np.arange(self.size)
+        self.neighbours = neighbours.tolist()
+
+    def distance(self, a, b):
+        return math.hypot(self.xs[a] - self.xs[b], self.ys[a] - self.ys[b])
+
+    def successor(self, city):
+        return int(self.tour[(self.position[city] + 1) % self.size])
+
+    def predecessor(self, city):
+        return int(self.tour[self.position[city] - 1])
+
+    def run(self):
+        active = deque(self.tour.tolist())
+        looking = [True] * self.size  # the don't-look bit is off
+        while active:
+            city = active.popleft()
+            looking[city] = False
+            touched = self.two_opt(city) or self.or_opt(city)
+            if touched:
+                for touched_city in touched:
+                    if not looking[touched_city]:
+                        looking[touched_city] = True
+                        active.append(touched_city)
+                # the city may still have improving moves
+                if not looking[city]:
+                    looking[city] = True
+                    active.appendleft(city)
+        return self.tour
+
+    def two_opt(self, a):
+        """replaces edges (a, b) and (c, d) with (a, c) and (b, d), returns the touched cities or None"""
+        for step in (self.successor, self.predecessor):
+            b = step(a)
+            d_ab = self.distance(a, b)
+            for c in self.neighbours[a]:
+                if c == a:
+                    continue
+                gain_first = d_ab - self.distance(a, c)
+                if gain_first <= self.EPSILON:
+                    break
+                d = step(c)
+                if c == b or d == a:
+                    continue
+                if gain_first + self.distance(c, d) - self.distance(b, d) > self.EPSILON:
+                    if step == self.successor:
+                        self.reverse(b, c)
+                    else:
+                        self.reverse(c, b)
+                    return a, b, c, d
+        return None
+
+    def or_opt(self, a):
+        """moves the segment of 1 to 3 cities starting at a between two other adjacent cities"""
+        if self.size < 6:
+            return None
+        for segment_length in range(1, 4):
+            first = a
+            last = int(self.tour[(self.position[a] + segment_length - 1) % self.size])
+            p, n = self.predecessor(first), self.successor(last)
+            removal_gain = self.distance(p, first) + self.distance(last, n) - self.distance(p, n)
+            if removal_gain <= self.EPSILON:
+                continue
+            segment = set(self.tour[(self.position[a] + np.arange(segment_length)) % self.size].tolist())
+            for end in (first, last):
+                for c in self.neighbours[end]:
+                    d_end_c = self.distance(end, c)
+                    if d_end_c >= removal_gain:
+                        break
+                    if c in segment:
+                        continue
+                    for u, w in ((c, self.successor(c)), (self.predecessor(c), c)):
+                        if u in segment or w in segment:
+                            continue
+                        d_uw = self.distance(u, w)
+                        first_to_u = self.distance(u, first) + self.distance(last, w)
+                        last_to_u = self.distance(u, last) + self.distance(first, w)
+                        if removal_gain - min(first_to_u, last_to_u) + d_uw > self.EPSILON:
+                            self.move_segment(first, segment_length, u, first_to_u <= last_to_u)
+                            return p, n, first, last, u, w
+        return None
+
+    def reverse(self, from_city, to_city):
+        """reverses the tour path going forward from from_city to to_city"""
+        i, j = self.position[from_city], self.position[to_city]
+        if i > j or (j - i + 1) * 2 > self.size and (i == 0 or j == self.size - 1):
+            # the path wraps around the end of the array, reversing the rest of the tour is the same move
+            i, j = (j + 1) % self.size, (i - 1) % self.size
+            if i > j:
+                return
+        reversed_path = self.tour[i:j + 1][::-1].copy()
+        self.tour[i:j + 1] = reversed_path
+        self.position[reversed_path] = np.arange(i, j + 1)
+
+    def move_segment(self, first, segment_length, u, first_after_u):
+        """moves the segment starting at first between u and its successor, rewriting the shorter span"""
+        start = self.position[first]
+        # either [segment, n .. u] becomes [n .. u, segment] or [w .. p, segment] becomes [segment, w .. p]
+        forward_span = (self.position[u] - start) % self.size + 1
+        backward_span = (start + segment_length - 1 - self.position[u]) % self.size
+        if forward_span <= backward_span:
+            indices = (start + np.arange(forward_span)) % self.size
+            cities = self.tour[indices]
+            segment = cities[:segment_length] if first_after_u else cities[:segment_length][::-1]
+            new_cities = np.concatenate((cities[segment_length:], segment))
+        else:
+            indices = (self.position[u] + 1 + np.arange(backward_span)) % self.size
+            cities = self.tour[indices]
+            segment = cities[-segment_length:] if first_after_u else cities[-segment_length:][::-1]
+            new_cities = np.concatenate((segment, cities[:-segment_length]))
+        self.tour[indices] = new_cities
+        self.position[new_cities] = indices
+
+
+def solve_tsp_branch_and_bound(cities_count, cities, node_limit=None, report_every=100):
+    """
+    Exact TSP by best-first branch and bound on Held-Karp 1-tree lower bounds.
+    A 1-tree is a minimum spanning tree of the cities 1..n-1 plus the two cheapest edges of city 0, every tour
+    is a 1-tree, so its cost is a lower bound. Node penalties pi are tuned by subgradient optimization to push
+    the degrees towards 2, which raises the bound of the 1-tree with costs c(i, j) + pi(i) + pi(j) minus 2 * sum(pi).
+    The incumbent starts from solve_tsp_heuristic. A node branches on a city of degree > 2 in its 1-tree
+    by excluding or including its tree edges. Progress (nodes explored, bound, incumbent, gap) is logged
+    every report_every nodes. With node_limit the search may stop early with the best tour found so far.
+    Returns the tour length and the tour starting at city 0.
+    """
+    dist = distance.cdist(cities, cities, 'euclidean')
+    if cities_count <= 3:
+        tour = list(range(cities_count))
+        return tour_length(np.asarray(cities, dtype='float64'), tour), tour
+    upper_bound, tour = solve_tsp_heuristic(cities_count, cities)
+    tour = tour.tolist()
+    logger.info('Initial incumbent: {0:.2f}'.format(upper_bound))
+    counter = itertools.count()  # breaks ties in the heap
+    open_nodes = []
+    nodes_explored = 0
+    root = held_karp_bound(dist, (), (), np.zeros(cities_count), upper_bound, ROOT_SUBGRADIENT_ITERATIONS)
+    children = [((), (), root)]
+    while True:
+        for child_included, child_excluded, child in children:
+            if child is None or child.bound >= upper_bound - BOUND_TOLERANCE:
+                continue
+            if child.tour is not None:
+                length = tour_length(np.asarray(cities, dtype='float64'), child.tour)
+                if length < upper_bound:
+                    upper_bound, tour = length, child.tour
+                    logger.info('New incumbent: {0:.2f}'.format(upper_bound))
+            heapq.heappush(open_nodes, (child.bound, next(counter), child_included, child_excluded, child))
+        if not open_nodes:
+            break
+        lower_bound = open_nodes[0][0]
+        if lower_bound >= upper_bound - BOUND_TOLERANCE:
+            break
+        if node_limit is not None and nodes_explored >= node_limit:
+            logger.info('Node limit reached')
+            break
+        bound, _, included, excluded, node = heapq.heappop(open_nodes)
+        nodes_explored += 1
+        if nodes_explored % report_every == 0:
+            log_branch_and_bound_progress(nodes_explored, len(open_nodes), lower_bound, upper_bound)
+        children = []
+        if node.tour is not None:
+            # the 1-tree is a tour, nothing to branch on
+            continue
+        for child_included, child_excluded in branch(node, included, excluded):
+            child = held_karp_bound(dist, child_included, child_excluded, node.pi, upper_bound,
+                                    SUBGRADIENT_ITERATIONS)
+            children.append((child_included, child_excluded, child))
+    lower_bound = min(open_nodes[0][0], upper_bound) if open_nodes else upper_bound
+    log_branch_and_bound_progress(nodes_explored, len(open_nodes), lower_bound, upper_bound)
+    start = tour.index(0)
+    return upper_bound, tour[start:] + tour[:start]
+
+
+def log_branch_and_bound_progress(nodes_explored, nodes_open, lower_bound, upper_bound):
+    gap = max(0.0, (upper_bound - lower_bound) / upper_bound) if upper_bound else 0.0
+    logger.info('Nodes explored: {0}, open: {1}, bound: {2:.2f}, incumbent: {3:.2f}, gap: {4:.4%}'.format(
+        nodes_explored, nodes_open, lower_bound, upper_bound, gap))
+
+
+# the result of the subgradient optimization at a branch and bound node
+OneTreeBound = namedtuple('OneTreeBound', ['bound', 'pi', 'edges', 'degrees', 'tour'])
+
+# subgradient iterations at the root and at the other nodes, which start from the penalties of their parent
+ROOT_SUBGRADIENT_ITERATIONS = 300
+SUBGRADIENT_ITERATIONS = 50
+# nodes whose bound is within that much of the incumbent can't hold a shorter tour
+BOUND_TOLERANCE = 1e-7
+
+
+def held_karp_bound(dist, included, excluded, pi, upper_bound, iterations):
+    """
+    subgradient optimization of the 1-tree bound with the given edges forced in and out,
+    returns OneTreeBound for the best penalties found or None if no tour satisfies the constraints
+    """
+    cities_count = len(dist)
+    base = dist.copy()
+    forced = np.zeros(dist.shape, dtype=bool)
+    for i, j in excluded:
+        base[i, j] = base[j, i] = np.inf
+    for i, j in included:
+        forced[i, j] = forced[j, i] = True
+    forced_degrees = forced.sum(axis=1)
+    if (forced_degrees > 2).any():
+        return None
+    # a city with two forced edges can't have any other
+    full = forced_degrees == 2
+    base[(full[:, np.newaxis] | full[np.newaxis, :]) & ~forced] = np.inf
+    np.fill_diagonal(base, np.inf)
+    # forced edges get a huge discount so that any spanning tree picks them first
+    discount = np.where(forced, FORCED_EDGE_DISCOUNT, 0.0)
+    pi = pi.copy()
+    best = None
+    step = 2.0
+    since_improvement = 0
+    for _ in range(iterations):
+        penalized = base + pi[:, np.newaxis] + pi[np.newaxis, :]
+        tree = one_tree(penalized - discount)
+        if tree is None:
+            return None
+        edges, degrees = tree
+        if not forced[edges[:, 0], edges[:, 1]].sum() == len(included):
+            # the forced edges close a cycle or can't all be taken
+            return None
+        bound = penalized[edges[:, 0], edges[:, 1]].sum() - 2 * pi.sum()
+        if best is None or bound > best.bound:
+            best = OneTreeBound(bound, pi.copy(), edges, degrees, None)
+            since_improvement = 0
+        else:
+            since_improvement += 1
+            if since_improvement >= max(1, iterations // 10):
+                step /= 2
+                since_improvement = 0
+        subgradient = degrees - 2
+        if not subgradient.any():
+            return best._replace(tour=tour_from_edges(edges, cities_count))
+        if bound >= upper_bound - BOUND_TOLERANCE:
+            break
+        pi += step * (upper_bound - bound) / (subgradient @ subgradient) * subgradient
+    return best
+
+
+FORCED_EDGE_DISCOUNT = 1e9
+
+
+def one_tree(cost):
+    """
+    minimum 1-tree for a symmetric cost matrix with np.inf for the missing edges: Prim's MST on cities 1..n-1
+    plus the two cheapest edges of city 0. Returns (edges array of shape (n, 2), degrees) or None
+    if there's no 1-tree.
+    """
+    cities_count = len(cost)
+    in_tree = np.zeros(cities_count, dtype=bool)
+    in_tree[:2] = True
+    best = cost[1].copy()
+    parents = np.ones(cities_count, dtype='int64')
+    edges = []
+    for _ in range(cities_count - 2):
+        candidates = np.where(in_tree, np.inf, best)
+        city = int(np.argmin(candidates))
+        if candidates[city] == np.inf:
+            return None
+        in_tree[city] = True
+        edges.append((int(parents[city]), city))
+        closer = cost[city] < best
+        best[closer] = cost[city][closer]
+        parents[closer] = city
+    nearest = np.argsort(cost[0, 1:], kind='stable')[:2] + 1
+    if cost[0, nearest[-1]] == np.inf:
+        return None
+    edges.extend((0, int(city)) for city in nearest)
+    edges = np.array(edges)
+    degrees = np.bincount(edges.ravel(), minlength=cities_count)
+    return edges, degrees
+
+
+def tour_from_edges(edges, cities_count):
+    """walks a 1-tree in which every city has degree 2, i.e. a tour"""
+    links = [[] for _ in range(cities_count)]
+    for i, j in edges.tolist():
+        links[i].append(j)
+        links[j].append(i)
+    tour = [0, links[0][0]]
+    while len(tour) < cities_count:
+        a, b = links[tour[-1]]
+        tour.append(a if a != tour[-2] else b)
     return tour
 
 
+def branch(node, included, excluded):
+    """
+    children of a node for a city v of degree > 2 in its 1-tree and two of its free tree edges e1, e2:
+    e1 excluded; e1 included and e2 excluded; both included (so every other edge of v is out)
+    """
+    forced = set(included)
+    degrees = node.degrees
+    city = int(np.argmax(degrees))
+    free_edges = [tuple(sorted(edge)) for edge in node.edges.tolist()
+                  if city in edge and tuple(sorted(edge)) not in forced]
+    forced_at_city = sum(1 for edge in included if city in edge)
+    first = free_edges[0]
+    children = [(included, excluded + (first,))]
+    if forced_at_city == 0 and len(free_edges) > 1:
+        second = free_edges[1]
+        children.append((included + (first,), excluded + (second,)))
+        children.append((included + (first, second), excluded))
+    else:
+        children.append((included + (first,), excluded))
+    return children
+
+
 def distances(points):
     result = distance.cdist(points, points, 'euclidean')
     np.fill_diagonal(result, np.inf)
     return result
 
 
-def bit_sets(powers, k):
-    result = defaultdict(set)
-    for bits in itertools.combinations(powers.keys(), k):
-        result[sum(bits)] = {powers[bit] for bit in bits}
-    # logger.info('Generated bit sets')
-    return result
-
 if __name__ == '__main__':
     # initialize logging to console
     logger = logging.getLogger()
@@ -94,5 +678,7 @@ if __name__ == '__main__':
     logger.info('Start')
     n, array = load_data('tsp.txt')
     t1 = time.time()
-    logger.info('Optimal TSP tour length is: {0:.2f}'.format(solve_tsp(n, array)))
+    length, optimal_tour = solve_tsp_layered(n, array, return_tour=True, processes=os.cpu_count())
+    logger.info('Optimal TSP tour length is: {0:.2f}'.format(length))
+    logger.info('Tour: {0}'.format(optimal_tour))
     logger.info('Solved in {0:.3f}s'.format(time.time() - t1))
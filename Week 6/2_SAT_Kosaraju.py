@@ -5,56 +5,22 @@ and 0 otherwise. For example, if you think that the first 3 instances are satisf
 then you should enter the string 111000 in the box below.
 """
 import logging
+import os
 import sys
-from collections import deque, defaultdict
+import time
+from collections import defaultdict
+import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.csr_graph import CSRGraph  # noqa: E402
+from common.loader import load_table  # noqa: E402
 
-class Kosaraju:
-    def __init__(self, graph, rev_graph):
-        self.__graph, self.__rev_graph = graph, rev_graph
-        self.__current_leader = None
-        self.__leaders = defaultdict(set)
-        self.__done, self.__explored = set(), set()
-        self.__order = deque()
+# solve_incrementally feeds the clauses of a file in this many batches
+INCREMENTAL_BATCHES = 10
+# Incremental2SAT solves all its clauses again instead of adding a batch of at least that fraction of them
+INCREMENTAL_RESOLVE_FRACTION = 0.05
 
-    def __dfs(self, graph, node):
-        # stack realization
-        stack = deque([node])
-        while stack:
-            vertex = stack.pop()
-            if vertex not in self.__explored:
-                self.__explored.add(vertex)
-                # on the first pass __current_leader == None
-                if self.__current_leader is not None:
-                    self.__leaders[self.__current_leader].add(vertex)
-                # vertex will be popped after all its adjacent vertices
-                stack.append(vertex)
-                to_add = graph[vertex] - self.__explored if vertex in graph else set()
-                if len(to_add) > 0:
-                    stack.extend(to_add)
-            # it's the second time we pop vertex from stack
-            else:
-                if vertex not in self.__done:
-                    self.__done.add(vertex)
-                    self.__order.appendleft(vertex)
-
-    def __calculate_magic_numbers(self):
-        for node in self.__rev_graph.keys():
-            if node not in self.__explored:
-                self.__dfs(self.__rev_graph, node)
-
-    def __calculate_leaders(self):
-        self.__calculate_magic_numbers()
-        self.__explored = set()
-        for node in self.__order:
-            if node not in self.__explored:
-                self.__current_leader = node
-                self.__dfs(self.__graph, node)
-
-    @property
-    def leaders(self):
-        self.__calculate_leaders()
-        return self.__leaders
+logger = logging.getLogger(__name__)
 
 
 def load_data(file_name):
@@ -64,33 +30,372 @@ def load_data(file_name):
     Each subsequent line specifies a clause via its two literals, with a number denoting the variable
     and a "-" sign denoting logical "not". For example, the second line of the first data file is "-16808 75250",
     which indicates the clause ¬x16808 OR x75250.
+    Returns the number of variables and an (m, 2) array of the literal ids of the clauses,
+    literal x is 2(x-1) and ¬x is 2(x-1)+1, so the negation of a literal is always literal ^ 1.
+    """
+    (variables_count,), clauses = load_table(file_name, columns=2)
+    return variables_count, literal_ids(clauses)
+
+
+def literal_ids(literals):
+    """maps signed 1-based literals to vertex ids: x -> 2(x-1), -x -> 2(x-1)+1"""
+    return 2 * (np.abs(literals) - 1) + (literals < 0)
+
+
+def implication_graph(variables_count, clauses):
+    """the implication graph in CSR form, its vertices are the literal ids"""
+    # clause (a OR b) gives implications ¬a -> b and ¬b -> a
+    tails = np.concatenate((clauses[:, 0] ^ 1, clauses[:, 1] ^ 1))
+    heads = np.concatenate((clauses[:, 1], clauses[:, 0]))
+    return CSRGraph.from_edges(2 * variables_count, tails, heads)
+
+
+def eliminate_pure_literals(variables_count, clauses):
+    """
+    a literal whose negation appears in no clause can be set to true, and the clauses it satisfies dropped.
+    Dropping them makes other literals pure, so it's repeated until nothing changes.
+    Returns the remaining clauses, the literals set to true and the number of rounds
+    """
+    fixed = []
+    rounds = 0
+    negations = np.arange(2 * variables_count) ^ 1
+    while len(clauses):
+        counts = np.bincount(clauses.ravel(), minlength=2 * variables_count)
+        pure = (counts > 0) & (counts[negations] == 0)
+        if not pure.any():
+            break
+        fixed.append(np.flatnonzero(pure))
+        clauses = clauses[~(pure[clauses[:, 0]] | pure[clauses[:, 1]])]
+        rounds += 1
+    fixed = np.concatenate(fixed) if fixed else np.zeros(0, dtype=np.int64)
+    return clauses, fixed, rounds
+
+
+def strongly_connected_components(graph):
+    """
+    single-pass iterative Tarjan over the CSR arrays of the graph.
+    Returns (components, count): components[v] is the id of the SCC of vertex v. The SCCs are numbered
+    in the order they are completed, which is a reverse topological order of the condensation.
+    The recursion is replaced by two index stacks: the DFS path with a cursor into the out-edges of every vertex
+    on it, and the Tarjan stack of visited vertices without a component yet.
+    """
+    vertices_count = graph.number_of_vertices
+    offsets, targets = graph.offsets.tolist(), graph.targets.tolist()
+    cursor = offsets[:-1]
+    index, low = [-1] * vertices_count, [0] * vertices_count
+    components = [-1] * vertices_count
+    path, stack = [], []
+    counter = count = 0
+    for root in range(vertices_count):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        path.append(root)
+        stack.append(root)
+        while path:
+            vertex = path[-1]
+            edge = cursor[vertex]
+            if edge < offsets[vertex + 1]:
+                cursor[vertex] = edge + 1
+                head = targets[edge]
+                if index[head] == -1:
+                    index[head] = low[head] = counter
+                    counter += 1
+                    path.append(head)
+                    stack.append(head)
+                elif components[head] == -1 and index[head] < low[vertex]:
+                    # head is still on the Tarjan stack
+                    low[vertex] = index[head]
+                continue
+            # all out-edges are done, return to the parent
+            path.pop()
+            if low[vertex] == index[vertex]:
+                # vertex is the root of its SCC, the SCC is the top of the stack down to vertex
+                while True:
+                    member = stack.pop()
+                    components[member] = count
+                    if member == vertex:
+                        break
+                count += 1
+            elif low[vertex] < low[path[-1]]:
+                low[path[-1]] = low[vertex]
+    return np.array(components, dtype=np.int32), count
+
+
+class Incremental2SAT:
+    """
+    2-SAT over a growing set of clauses, literal ids as in load_data.
+    A batch that is large next to the clauses so far (INCREMENTAL_RESOLVE_FRACTION) is cheaper to take by solving
+    all the clauses again with condensation_order, whose pure literal rounds are vectorized.
+    Smaller batches go into the implication graph one edge at a time:
+    the graph is kept as adjacency lists, its SCCs as a union-find over the literals in a Python list,
+    since the searches look up one literal at a time, and the
+    condensation in a topological order maintained the Pearce-Kelly way: an edge going forward in the order changes
+    nothing, an edge tail -> head going backward only searches the components placed between head and tail,
+    forward from head and backward from tail. If the forward search reaches tail, the edge closed a cycle and
+    the components found by both searches become one SCC, then the visited components are reordered
+    within the positions they already had.
+    The positions are distinct integers rather than a permutation, so a head with no out-edges can skip the searches
+    and move past everything to a new position at the top, and a tail with no in-edges to one at the bottom.
+    The lists are built from the last solve when the first small batch comes.
+    Once a batch makes the instance unsatisfiable, further clauses can't fix it and are only counted.
+    """
+
+    def __init__(self, variables_count):
+        self.__variables_count = variables_count
+        self.__clauses = [np.zeros((0, 2), dtype=np.int64)]
+        self.__clauses_count = 0
+        # the SCC roots and positions of the last solve as numpy arrays, until the lists are built from them
+        self.__roots = np.arange(2 * variables_count)
+        self.__positions = np.arange(2 * variables_count)
+        # the parent of every literal in the union-find, a component is the tree of its root
+        self.__parents = None
+        # the position of every component in the topological order, indexed by its root
+        self.__order = None
+        self.__bottom = self.__top = None
+        # the edge lists and the members of components that aren't single literals are only created when needed,
+        # millions of empty lists would keep the garbage collector busy
+        self.__out_edges = self.__in_edges = self.__members = None
+        self.__satisfiable = True
+        self.batches = 0
+        self.first_unsatisfiable_batch = None
+
+    def add_clauses(self, clauses):
+        """adds an (m, 2) array of literal ids, returns whether the instance is still satisfiable"""
+        if self.__satisfiable:
+            clauses = np.asarray(clauses)
+            self.__clauses_count += len(clauses)
+            if len(clauses) >= INCREMENTAL_RESOLVE_FRACTION * self.__clauses_count:
+                self.__clauses.append(clauses)
+                self.__resolve()
+            else:
+                if self.__parents is None:
+                    self.__build_lists()
+                self.__clauses.append(clauses)
+                self.__add_edges(clauses)
+            if not self.__satisfiable:
+                self.first_unsatisfiable_batch = self.batches
+        self.batches += 1
+        return self.__satisfiable
+
+    def is_satisfiable(self):
+        return self.__satisfiable
+
+    def model(self):
+        """a satisfying assignment as a boolean array over the variables, or None if there is none"""
+        if not self.__satisfiable:
+            return None
+        if self.__parents is None:
+            positions = self.__positions
+        else:
+            positions = np.array([self.__order[self.__find(literal)] for literal in range(len(self.__order))])
+        # x is true if its SCC comes after the SCC of ¬x in topological order
+        return positions[0::2] > positions[1::2]
+
+    def __resolve(self):
+        """solves all the clauses again, the lists are dropped until the next small batch"""
+        self.__clauses = [np.concatenate(self.__clauses)]
+        order = condensation_order(self.__variables_count, self.__clauses[0])
+        self.__parents = self.__order = self.__out_edges = self.__in_edges = self.__members = None
+        if order is None:
+            self.__satisfiable = False
+        else:
+            self.__roots, self.__positions = order
+
+    def __build_lists(self):
+        """the union-find, the order and the edge lists from the SCCs of the last solve"""
+        roots, positions = self.__roots, self.__positions
+        self.__parents, self.__order = roots.tolist(), positions.tolist()
+        self.__bottom, self.__top = int(positions.min()) - 1, int(positions.max()) + 1
+        self.__members = {}
+        grouped = np.argsort(roots, kind='stable')
+        starts = np.flatnonzero(np.diff(roots[grouped], prepend=-1))
+        sizes = np.diff(np.append(starts, len(roots)))
+        for start, size in zip(starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+            literals = grouped[start:start + size].tolist()
+            self.__members[int(roots[literals[0]])] = literals
+        self.__out_edges, self.__in_edges = defaultdict(list), defaultdict(list)
+        clauses = np.concatenate(self.__clauses)
+        # clause (a OR b) gives implications ¬a -> b and ¬b -> a
+        tails = np.concatenate((clauses[:, 0] ^ 1, clauses[:, 1] ^ 1))
+        heads = np.concatenate((clauses[:, 1], clauses[:, 0]))
+        apart = roots[tails] != roots[heads]
+        tails, heads = tails[apart], heads[apart]
+        for edges, keys, values in ((self.__out_edges, roots[tails], heads), (self.__in_edges, roots[heads], tails)):
+            grouped = np.argsort(keys, kind='stable')
+            keys, values = keys[grouped], values[grouped].tolist()
+            starts = np.flatnonzero(np.diff(keys, prepend=-1))
+            ends = np.append(starts[1:], len(keys)).tolist()
+            for key, start, end in zip(keys[starts].tolist(), starts.tolist(), ends):
+                edges[key] = values[start:end]
+        self.__roots = self.__positions = None
+
+    def __add_edges(self, clauses):
+        """adds the implications of the clauses one at a time, stops once they make the instance unsatisfiable"""
+        # clause (a OR b) gives implications ¬a -> b and ¬b -> a, in that order
+        tails = np.column_stack((clauses[:, 0] ^ 1, clauses[:, 1] ^ 1)).ravel().tolist()
+        heads = clauses[:, ::-1].ravel().tolist()
+        find, parents, order = self.__find, self.__parents, self.__order
+        out_edges, in_edges = self.__out_edges, self.__in_edges
+        for tail, head in zip(tails, heads):
+            # most literals are roots or one step below, find is only called for the rest
+            tail_root, head_root = parents[tail], parents[head]
+            if parents[tail_root] != tail_root:
+                tail_root = find(tail)
+            if parents[head_root] != head_root:
+                head_root = find(head)
+            if tail_root == head_root:
+                # the SCCs only grow, an edge inside one never matters again
+                continue
+            out_edges[tail_root].append(head)
+            in_edges[head_root].append(tail)
+            if order[tail_root] < order[head_root]:
+                continue
+            self.__add_backward_edge(tail_root, head_root)
+            if not self.__satisfiable:
+                # the rest of the batch can't fix it either
+                return
+
+    def __add_backward_edge(self, tail_root, head_root):
+        """restores the order after an edge from the component tail_root to head_root placed before it"""
+        order = self.__order
+        lower, upper = order[head_root], order[tail_root]
+        # neither can be on a cycle, the literals of most clauses are still like that until the last batches
+        if not self.__out_edges.get(head_root):
+            order[head_root] = self.__top
+            self.__top += 1
+            return
+        if not self.__in_edges.get(tail_root):
+            order[tail_root] = self.__bottom
+            self.__bottom -= 1
+            return
+        forward = self.__search(head_root, self.__out_edges, lower, upper)
+        backward = self.__search(tail_root, self.__in_edges, lower, upper)
+        if len(forward) == 1 and len(backward) == 1:
+            # nothing else in between is connected to them, swapping the two is enough
+            order[tail_root], order[head_root] = lower, upper
+            return
+        positions = sorted(order[root] for root in forward | backward)
+        merged = []
+        if tail_root in forward:
+            cycle = forward & backward
+            forward -= cycle
+            backward -= cycle
+            merged.append(self.__merge(cycle))
+        # what reaches tail goes first, what head reaches goes last, the new SCC in between
+        # the forward part only moves later and the backward part only earlier, so the edges outside stay forward
+        ranked = sorted(backward, key=order.__getitem__) + merged
+        for root, position in zip(ranked, positions):
+            order[root] = position
+        ranked = sorted(forward, key=order.__getitem__)
+        for root, position in zip(ranked, positions[len(positions) - len(ranked):]):
+            order[root] = position
+
+    def __search(self, start, edges, lower, upper):
+        """the components reachable from start along edges that are placed within [lower, upper]"""
+        find, order, parents = self.__find, self.__order, self.__parents
+        seen = {start}
+        stack = [start]
+        while stack:
+            for literal in edges.get(stack.pop(), ()):
+                root = parents[literal]
+                if parents[root] != root:
+                    root = find(literal)
+                if root not in seen and lower <= order[root] <= upper:
+                    seen.add(root)
+                    stack.append(root)
+        return seen
+
+    def __find(self, literal):
+        parents = self.__parents
+        while parents[literal] != literal:
+            # path halving: point every other literal on the way to its grandparent
+            parents[literal] = parents[parents[literal]]
+            literal = parents[literal]
+        return literal
+
+    def __merge(self, cycle):
+        """
+        merges the components into one and returns its root, the smaller ones are checked for x and ¬x.
+        The roots of the smaller ones are hooked under the root of the largest, i.e. union by size.
+        """
+        members = self.__members
+        merged = max(cycle, key=lambda root: len(members.get(root, (root,))))
+        smaller = [root for root in cycle if root != merged]
+        moved = [literal for root in smaller for literal in members.pop(root, (root,))]
+        for root in smaller:
+            self.__parents[root] = merged
+            self.__out_edges[merged].extend(self.__out_edges.pop(root, ()))
+            self.__in_edges[merged].extend(self.__in_edges.pop(root, ()))
+        members.setdefault(merged, [merged]).extend(moved)
+        # pairs inside the largest one were checked when it was built
+        if any(self.__find(literal ^ 1) == merged for literal in moved):
+            self.__satisfiable = False
+        return merged
+
+
+def check_2_sat(components):
+    """the instance is satisfiable unless some x and ¬x, vertices 2x and 2x+1, end up in the same SCC"""
+    return not np.any(components[0::2] == components[1::2])
+
+
+def condensation_order(variables_count, clauses):
+    """
+    the SCCs of the implication graph and a topological order of them, or None if the instance is unsatisfiable.
+    Returns (roots, positions): roots[v] is the literal standing for the SCC of literal v and positions[v] is the place
+    of that SCC in the order. The pure literals go first, then the SCCs of the clauses that are left:
+    a pure literal has no out-edges and its negation no in-edges once the clauses of earlier rounds are gone,
+    so the negations go at the start in the order of the rounds and the pure literals at the end in the reverse order.
     """
-    graph, rev_graph = defaultdict(set), defaultdict(set)
-    # the size of the file is reasonable for this problem, can speed things up by loading the whole file
-    with open(file_name) as data:
-        file_contents = data.read()
-    # build both graph and reversed graph in one go
-    lines = file_contents.split('\n')
-    lines.pop(0)
-    for line in lines:
-        spl = line.split()
-        if spl:
-            var1, var2 = map(int, spl)
-            graph[-var1].add(var2)
-            graph[-var2].add(var1)
-            rev_graph[var2].add(-var1)
-            rev_graph[var1].add(-var2)
-    return graph, rev_graph
-
-
-def check_2_sat(scc_dictionary):
-    for leader in scc_dictionary.keys():
-        for variable in scc_dictionary[leader]:
-            tmp = scc_dictionary[leader]
-            tmp.add(leader)
-            if -variable in tmp:
-                return False
-    return True
+    size = 2 * variables_count
+    t1 = time.time()
+    remaining, fixed, rounds = eliminate_pure_literals(variables_count, clauses)
+    logger.info('Pure literals: {0} variables fixed in {1} rounds, {2} of {3} clauses removed in {4:.3f}s'.format(
+        len(fixed), rounds, len(clauses) - len(remaining), len(clauses), time.time() - t1))
+    t1 = time.time()
+    # the variables left are renumbered, so the graph only has their literals
+    variables = np.unique(remaining >> 1)
+    graph = implication_graph(len(variables), 2 * np.searchsorted(variables, remaining >> 1) + (remaining & 1))
+    logger.info('Implication graph: {0} vertices, {1} edges built in {2:.3f}s'.format(
+        graph.number_of_vertices, graph.number_of_edges, time.time() - t1))
+    t1 = time.time()
+    components, count = strongly_connected_components(graph)
+    logger.info('Found {0} strongly connected components in {1:.3f}s'.format(count, time.time() - t1))
+    if not check_2_sat(components):
+        return None
+    roots = np.arange(size)
+    positions = np.empty(size, dtype=np.int64)
+    positions[fixed ^ 1] = np.arange(len(fixed))
+    literals = 2 * np.repeat(variables, 2) + np.tile([0, 1], len(variables))
+    _, first = np.unique(components, return_index=True)
+    roots[literals] = literals[first][components]
+    # Tarjan numbers the SCCs backwards
+    positions[literals] = len(fixed) + count - 1 - components
+    # the literals of the variables whose clauses all went with the pure literals only have edges from the negations
+    # and to the pure literals, they go in between with the variables in no clause at all
+    unused = np.ones(size, dtype=bool)
+    unused[fixed], unused[fixed ^ 1], unused[literals] = False, False, False
+    unused = np.flatnonzero(unused)
+    positions[unused] = len(fixed) + count + np.arange(len(unused))
+    positions[fixed] = len(fixed) + count + len(unused) + np.arange(len(fixed) - 1, -1, -1)
+    return roots, positions
+
+
+def solve_2_sat(variables_count, clauses):
+    """returns a satisfying assignment as a boolean array over the variables, or None if there is none"""
+    order = condensation_order(variables_count, clauses)
+    if order is None:
+        return None
+    _, positions = order
+    # x is true if its SCC comes after the SCC of ¬x in topological order
+    return positions[0::2] > positions[1::2]
+
+
+def check_model(model, clauses):
+    """checks that every clause has a true literal"""
+    literals_true = model[clauses >> 1] != (clauses & 1).astype(bool)
+    return bool(np.all(literals_true.any(axis=1)))
 
 
 def solve_assignment():
@@ -98,28 +403,41 @@ def solve_assignment():
     answer = str()
     for name in file_names:
         logger.info('Solving {0}'.format(name))
-        g1, g2 = load_data(name)
-        logger.info('Data loaded from file')
-        # initialize our Kosaraju object
-        kosaraju = Kosaraju(g1, g2)
-        logger.info('Kosaraju initialized')
-        # calculate leaders
-        leaders_dict = kosaraju.leaders
-        # check if instance is satisfiable
-        answer += '1' if check_2_sat(leaders_dict) else '0'
-        logger.info('Checked if 2 SAT is satisfiable: {0}'.format(check_2_sat(leaders_dict)))
+        t1 = time.time()
+        variables_count, clauses = load_data(name)
+        logger.info('Data loaded from file in {0:.3f}s'.format(time.time() - t1))
+        model = solve_2_sat(variables_count, clauses)
+        satisfiable = model is not None
+        answer += '1' if satisfiable else '0'
+        logger.info('Checked if 2 SAT is satisfiable: {0}'.format(satisfiable))
+        if satisfiable:
+            logger.info('Assignment checked: {0}'.format(check_model(model, clauses)))
     logger.info('Assignment answer: {0}'.format(answer))
 
+
+def solve_incrementally(file_name, batches=INCREMENTAL_BATCHES):
+    """feeds the clauses of the file to Incremental2SAT in batches, returns the first unsatisfiable batch or None"""
+    variables_count, clauses = load_data(file_name)
+    solver = Incremental2SAT(variables_count)
+    for batch in np.array_split(clauses, batches):
+        t1 = time.time()
+        satisfiable = solver.add_clauses(batch)
+        logger.info('Batch {0}: {1} clauses added in {2:.3f}s, satisfiable: {3}'.format(
+            solver.batches - 1, len(batch), time.time() - t1, satisfiable))
+    if solver.is_satisfiable():
+        logger.info('Assignment checked: {0}'.format(check_model(solver.model(), clauses)))
+    return solver.first_unsatisfiable_batch
+
 if __name__ == '__main__':
     # initialize logging to console
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(logging.INFO)
     formatter = logging.Formatter(fmt='%(asctime)s.%(msecs)03d %(levelname)s [%(funcName)s] %(message)s',
                                   datefmt='%Y-%m-%d\t%H:%M:%S')
     ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    root_logger.addHandler(ch)
     # actual start
     logger.info('Program started')
     solve_assignment()
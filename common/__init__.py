@@ -0,0 +1,3 @@
+"""
+Data structures shared by the solutions of different weeks.
+"""
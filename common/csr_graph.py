@@ -0,0 +1,83 @@
+"""
+Compressed sparse row (CSR) representation of a directed graph.
+Vertices are 0-based integers. The out-edges of vertex v are stored contiguously:
+heads targets[offsets[v]:offsets[v + 1]] with lengths weights[offsets[v]:offsets[v + 1]].
+That is 4 bytes per target plus the weight per edge, instead of a Python tuple in a set.
+"""
+import numpy as np
+from .loader import load_table
+
+# the largest number of edges that int32 offsets can address
+INT32_LIMIT = np.iinfo(np.int32).max
+
+
+class CSRGraph:
+    def __init__(self, offsets, targets, weights=None):
+        self.offsets = offsets  # (n + 1,) start of the out-edges of every vertex
+        self.targets = targets  # (m,) int32 heads of the edges
+        self.weights = weights  # (m,) edge lengths or None for an unweighted graph
+        self.__reverse = None
+
+    @classmethod
+    def from_edges(cls, number_of_vertices, tails, heads, weights=None):
+        """builds the graph from 0-based arrays of tails, heads and (optionally) weights with a counting sort"""
+        tails = np.asarray(tails)
+        heads = np.asarray(heads)
+        index_dtype = np.int32 if len(tails) <= INT32_LIMIT else np.int64
+        counts = np.bincount(tails, minlength=number_of_vertices)
+        offsets = np.zeros(number_of_vertices + 1, dtype=index_dtype)
+        np.cumsum(counts, out=offsets[1:])
+        # a stable sort keeps the order of edges from the file within every vertex
+        order = np.argsort(tails, kind='stable')
+        targets = heads[order].astype(np.int32)
+        if weights is not None:
+            weights = np.asarray(weights)[order]
+        return cls(offsets, targets, weights)
+
+    @classmethod
+    def from_file(cls, file_name, undirected=False):
+        """
+        reads the file with load_table and builds the graph
+        The first line starts with the number of vertices, each subsequent line is a 1-based edge: tail head length
+        """
+        header, edges = load_table(file_name, columns=3)
+        number_of_vertices = header[0]
+        tails, heads, weights = edges[:, 0] - 1, edges[:, 1] - 1, edges[:, 2]
+        if undirected:
+            tails, heads = np.concatenate((tails, heads)), np.concatenate((heads, tails))
+            weights = np.concatenate((weights, weights))
+        return cls.from_edges(number_of_vertices, tails, heads, weights)
+
+    @property
+    def number_of_vertices(self):
+        return len(self.offsets) - 1
+
+    @property
+    def number_of_edges(self):
+        return len(self.targets)
+
+    def out_degrees(self):
+        return np.diff(self.offsets)
+
+    def neighbours(self, vertex):
+        """returns the heads of the out-edges of vertex"""
+        return self.targets[self.offsets[vertex]:self.offsets[vertex + 1]]
+
+    def edge_weights(self, vertex):
+        """returns the lengths of the out-edges of vertex, aligned with neighbours(vertex)"""
+        return self.weights[self.offsets[vertex]:self.offsets[vertex + 1]]
+
+    def tails(self):
+        """returns the tail of every edge, aligned with targets and weights"""
+        return np.repeat(np.arange(self.number_of_vertices, dtype=np.int32), self.out_degrees())
+
+    def with_weights(self, weights):
+        """returns a graph with the same structure and new edge lengths, the structure arrays are shared"""
+        return CSRGraph(self.offsets, self.targets, weights)
+
+    def reverse(self):
+        """returns the graph with all edges reversed, it's built once and cached"""
+        if self.__reverse is None:
+            self.__reverse = CSRGraph.from_edges(self.number_of_vertices, self.targets, self.tails(), self.weights)
+            self.__reverse.__reverse = self
+        return self.__reverse
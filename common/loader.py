@@ -0,0 +1,150 @@
+"""
+Loader of the assignment data files: a header line followed by rows of whitespace-separated numbers.
+The rows are parsed by numpy from a memory map of the file in chunks of PARSE_CHUNK_BYTES, without a Python object
+per number, into an array allocated once, so the peak memory is the array and a chunk rather than the whole file.
+The parsed rows are saved in a .npy sidecar next to the file, its name carries the size and the mtime
+of the file, so a later load of the same unchanged file just memory-maps the sidecar.
+"""
+import contextlib
+import glob
+import mmap
+import os
+import tempfile
+import warnings
+import numpy as np
+
+SIDECAR_PATTERN = '{0}.cache-{1}-{2}.npy'
+# the size of the pieces of the memory map that are copied out and parsed at a time
+PARSE_CHUNK_BYTES = 1 << 24
+# a lookup table of the bytes np.fromstring takes as separators with sep=' '
+SEPARATORS = np.zeros(256, dtype=bool)
+SEPARATORS[list(b' \t\n\r\v\f')] = True
+
+
+def load_table(file_name, dtype=np.int64, columns=None, cache=True):
+    """
+    returns (header, rows): the list of the ints on the first line and an (m, columns) array of the other lines.
+    columns=None takes the number of numbers on the second line.
+    With cache=True the rows come from the sidecar when it's up to date, as a read-only memory map.
+    """
+    header = read_header(file_name)
+    sidecar = sidecar_name(file_name)
+    if cache and os.path.exists(sidecar):
+        rows = np.load(sidecar, mmap_mode='r')
+        if rows.dtype == np.dtype(dtype) and (columns is None or rows.shape[1] == columns):
+            return header, rows
+    rows = parse_file(file_name, dtype, columns)
+    if cache:
+        save_sidecar(file_name, sidecar, rows)
+    return header, rows
+
+
+def read_header(file_name):
+    with open(file_name) as data:
+        return [int(number) for number in data.readline().split()]
+
+
+def parse_file(file_name, dtype=np.int64, columns=None):
+    """parses everything after the header line into an (m, columns) array"""
+    with open(file_name, 'rb') as data:
+        if os.fstat(data.fileno()).st_size == 0:
+            return np.zeros((0, columns or 0), dtype=dtype)
+        with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            body = mapped.find(b'\n') + 1
+            if body == 0:
+                return np.zeros((0, columns or 0), dtype=dtype)
+            if columns is None:
+                line_end = mapped.find(b'\n', body)
+                columns = len(mapped[body:line_end if line_end != -1 else len(mapped)].split())
+            return to_rows(parse_mapped(mapped, body, dtype), columns)
+
+
+def parse_mapped(mapped, start, dtype=np.int64):
+    """
+    parses the numbers of mapped[start:] chunk by chunk, the chunks end on a line break.
+    The numbers of every chunk are counted over a zero-copy view of the map first, so the result is allocated once
+    and a chunk that doesn't parse to the end is caught.
+    """
+    bounds = [start]
+    while bounds[-1] < len(mapped):
+        end = bounds[-1] + PARSE_CHUNK_BYTES
+        if end < len(mapped):
+            line_break = mapped.rfind(b'\n', bounds[-1], end)
+            if line_break == -1:
+                # a line longer than a chunk, the chunk goes on to its end
+                line_break = mapped.find(b'\n', end)
+            end = line_break + 1 if line_break != -1 else len(mapped)
+        bounds.append(min(end, len(mapped)))
+    counts = [count_numbers(mapped, chunk_start, chunk_end) for chunk_start, chunk_end in zip(bounds, bounds[1:])]
+    numbers = np.empty(sum(counts), dtype=dtype)
+    offset = 0
+    for chunk_start, chunk_end, count in zip(bounds, bounds[1:], counts):
+        chunk = parse_numbers(mapped[chunk_start:chunk_end], dtype)
+        if len(chunk) != count:
+            raise ValueError('Only {0} of {1} numbers parsed between bytes {2} and {3}'.format(
+                len(chunk), count, chunk_start, chunk_end))
+        numbers[offset:offset + count] = chunk
+        offset += count
+    return numbers
+
+
+def count_numbers(mapped, start, end):
+    """the number of whitespace-separated tokens in mapped[start:end]"""
+    view = np.frombuffer(mapped, dtype=np.uint8, count=end - start, offset=start)
+    separators = SEPARATORS[view]
+    count = int(np.count_nonzero(separators[:-1] & ~separators[1:])) + int(len(view) > 0 and not separators[0])
+    # the map can't be closed while a view of it exists
+    del view
+    return count
+
+
+def parse_numbers(text, dtype=np.int64):
+    """
+    whitespace-separated numbers as a 1D array in one numpy call.
+    Older numpy stops at the first token it can't parse with only a DeprecationWarning, so that's made an error.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=dtype, sep=' ')
+        except DeprecationWarning as error:
+            raise ValueError(str(error)) from None
+
+
+def parse_rows(text, columns, dtype=np.int64):
+    """parses whitespace-separated numbers into an (m, columns) array in one numpy call"""
+    return to_rows(parse_numbers(text, dtype), columns)
+
+
+def to_rows(numbers, columns):
+    if columns == 0 or len(numbers) % columns:
+        raise ValueError('{0} numbers can\'t make rows of {1}'.format(len(numbers), columns))
+    return numbers.reshape(-1, columns)
+
+
+def sidecar_name(file_name):
+    stat = os.stat(file_name)
+    return SIDECAR_PATTERN.format(file_name, stat.st_size, stat.st_mtime_ns)
+
+
+def save_sidecar(file_name, sidecar, rows):
+    """
+    writes the rows to a temporary file and renames it, so a concurrent load never maps half a sidecar,
+    the sidecars of older versions of the file are removed. It's only a cache, so a read-only directory is fine.
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    try:
+        handle, temporary = tempfile.mkstemp(suffix='.npy', dir=directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            np.save(out, rows)
+        os.replace(temporary, sidecar)
+    except OSError:
+        os.remove(temporary)
+        return
+    for stale in glob.glob(glob.escape(file_name) + '.cache-*.npy'):
+        if stale != sidecar:
+            with contextlib.suppress(OSError):
+                os.remove(stale)
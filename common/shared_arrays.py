@@ -0,0 +1,79 @@
+"""
+numpy arrays placed in multiprocessing shared memory, so that the worker processes of a pool
+can map them once instead of getting a pickled copy with every task.
+The arrays can also be backed by memory-mapped files in a directory, so that they can spill to disk.
+"""
+from multiprocessing import shared_memory
+import os
+import tempfile
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Owns the shared memory blocks or files, the parent process creates them and releases them on close.
+    specs is a picklable description of the arrays to be passed to attach_arrays in the workers.
+    """
+
+    def __init__(self, directory=None, **arrays):
+        self.__directory = directory
+        self.__blocks = []
+        self.__files = []
+        self.arrays = {}
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            self.allocate(name, array.shape, array.dtype)[...] = array
+
+    def allocate(self, name, shape, dtype):
+        """creates a new zero-filled shared array and returns its view"""
+        dtype = np.dtype(dtype)
+        shape = tuple(shape)
+        if self.__directory is not None:
+            handle, path = tempfile.mkstemp(suffix='.npy', prefix=name + '_', dir=self.__directory)
+            os.close(handle)
+            self.__files.append(path)
+            view = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+            self.specs[name] = ('file', path, shape, dtype.str)
+        else:
+            size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self.__blocks.append(block)
+            view = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            view.fill(0)
+            self.specs[name] = ('memory', block.name, shape, dtype.str)
+        self.arrays[name] = view
+        return view
+
+    def close(self):
+        # the views must be gone before the buffers can be released
+        self.arrays.clear()
+        for block in self.__blocks:
+            block.close()
+            block.unlink()
+        for path in self.__files:
+            os.remove(path)
+        self.__blocks, self.__files = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def attach_arrays(specs):
+    """
+    maps the arrays described by specs in a worker process.
+    Returns the list of blocks, which must be kept alive as long as the arrays are used, and a dict of arrays.
+    """
+    blocks, arrays = [], {}
+    for name, (kind, location, shape, dtype) in specs.items():
+        if kind == 'file':
+            arrays[name] = np.load(location, mmap_mode='r+')
+            continue
+        # pool workers share the resource tracker of the parent, which unlinks the block
+        block = shared_memory.SharedMemory(name=location)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
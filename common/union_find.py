@@ -0,0 +1,83 @@
+"""
+Union-find over numpy int32 arrays.
+"""
+import numpy as np
+
+
+class UnionFind:
+    """
+    Lazy unions with ranks and path halving over dense node ids 0..size-1.
+    Sparse integer keys (e.g. 24-bit codes) can be mapped to dense ids with from_keys and ids.
+    The number of clusters is kept up to date on every union, so cluster_count is O(1).
+    """
+
+    def __init__(self, size):
+        self.parents = np.arange(size, dtype=np.int32)
+        self.ranks = np.zeros(size, dtype=np.int8)
+        self.cluster_count = size
+        self.keys = None
+
+    @classmethod
+    def from_keys(cls, keys):
+        """a union-find with one node per distinct key"""
+        keys = np.unique(keys)
+        uf = cls(len(keys))
+        uf.keys = keys
+        return uf
+
+    def ids(self, keys):
+        """the node ids of the given keys"""
+        return np.searchsorted(self.keys, keys)
+
+    def find(self, node):
+        parents = self.parents
+        while parents[node] != node:
+            # path halving: point every other node on the way to its grandparent
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return int(node)
+
+    def union(self, node_i, node_j):
+        """returns True if the nodes were in different clusters"""
+        parent_i = self.find(node_i)
+        parent_j = self.find(node_j)
+        if parent_i == parent_j:
+            return False
+        if self.ranks[parent_i] > self.ranks[parent_j]:
+            self.parents[parent_j] = parent_i
+        else:
+            self.parents[parent_i] = parent_j
+            # only if the ranks are equal, the new parent will have its rank increased
+            if self.ranks[parent_i] == self.ranks[parent_j]:
+                self.ranks[parent_j] += 1
+        self.cluster_count -= 1
+        return True
+
+    def find_many(self, nodes):
+        """the roots of an array of nodes, halving the paths of all of them at once"""
+        parents = self.parents
+        nodes = np.array(nodes, dtype=np.int32)
+        walking = np.flatnonzero(parents[nodes] != nodes)
+        while len(walking):
+            current = nodes[walking]
+            parents[current] = parents[parents[current]]
+            nodes[walking] = parents[current]
+            walking = walking[parents[nodes[walking]] != nodes[walking]]
+        return nodes
+
+    def union_many(self, nodes_i, nodes_j):
+        """
+        unites every pair (nodes_i[k], nodes_j[k]).
+        In each round the root with the larger id of every pair still apart is hooked under the other root,
+        a root hooked by several pairs takes one of them and the rest retry in the next round.
+        Hooking only to smaller ids can't create a cycle.
+        """
+        nodes_i = np.array(nodes_i, dtype=np.int32)
+        nodes_j = np.array(nodes_j, dtype=np.int32)
+        while len(nodes_i):
+            roots_i, roots_j = self.find_many(nodes_i), self.find_many(nodes_j)
+            apart = roots_i != roots_j
+            nodes_i, nodes_j, roots_i, roots_j = nodes_i[apart], nodes_j[apart], roots_i[apart], roots_j[apart]
+            high, low = np.maximum(roots_i, roots_j), np.minimum(roots_i, roots_j)
+            self.parents[high] = low
+            self.cluster_count -= len(np.unique(high))